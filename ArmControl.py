@@ -1,30 +1,45 @@
 import time
-from board import SCL, SDA
-import busio
-from adafruit_pca9685 import PCA9685
-from adafruit_motor import servo
+import threading
+import ServoDriver as sd
+import TrajectoryCache as tc
+import Kinematics as kin
+import Calibration as cal
 import VisionModule as vm
 import numpy as np
-from math import sqrt, copysign
-
-# Setup I2C and PCA9685
-i2c = busio.I2C(SCL, SDA)
-pca = PCA9685(i2c, address=0x40)
-pca.frequency = 50  # Set PWM frequency to 50 Hz for servos
-
-# Initialize servos on channels 1-5 (servo 0-4)
-servos = [
-    servo.Servo(pca.channels[1], min_pulse=500, max_pulse=2500),  # Servo 0 (MG995, Base)
-    servo.Servo(pca.channels[2], min_pulse=500, max_pulse=2500),  # Servo 1 (MG995, Shoulder)
-    servo.Servo(pca.channels[3], min_pulse=500, max_pulse=2500),  # Servo 2 (MG995, Elbow)
-    servo.Servo(pca.channels[4], min_pulse=500, max_pulse=2500),  # Servo 3 (MG90S, Wrist)
-    servo.Servo(pca.channels[5], min_pulse=500, max_pulse=2500),  # Servo 4 (MG90S, Gripper)
-]
+from math import copysign
+
+# Servo backend, the PCA9685 board is opened on first use so the module imports off the Pi
+driver = None
+
+# Square to square trajectories of the current calibration
+trajectory_cache = tc.TrajectoryCache(maxsize=2 * 65 * 65)  # Every pair of squares + graveyard, gripper open or closed
+TRAJECTORY_CACHE_FILE = 'trajectory_cache.pkl'
 
 # Global list to track current angles of each servo
 current_angles = [90, 90, 30, 90, 0]  # Initial/rest position
-
-# Lookup table for servo angles based on green_chess_board.docx
+angles_rest = [90, 90, 30, 90, 0]  # Rest position: [S0, S1, S2, S3, S4]
+
+# Coordinated motion: every tick all joints are updated along a trapezoidal speed profile
+STEP_TIME = 0.02  # Default seconds per control tick (one PWM period at 50 Hz), drivers set their own tick_rate
+
+# Motion limits per joint: (max velocity in deg/s, max acceleration in deg/s^2)
+JOINT_LIMITS = [
+    (90, 180),   # Servo 0 (MG995, Base)
+    (60, 120),   # Servo 1 (MG995, Shoulder)
+    (60, 120),   # Servo 2 (MG995, Elbow)
+    (120, 360),  # Servo 3 (MG90S, Wrist)
+    (120, 360),  # Servo 4 (MG90S, Gripper)
+]
+gClose = 10  # Gripper closed
+gOpen = 25  # Gripper open
+GRIP_SPEED = 0.5  # Gentler closing of the gripper on a piece
+PICK_DEPTH = 0.6  # goDown when picking, in piece heights below the top of the tallest piece
+PLACE_DEPTH = 0.5  # goDown when placing
+
+# Measured servo angles based on green_chess_board.docx, the Kinematics.angleTable solution
+# is corrected by a calibration surface so that it passes through them
+MEASURED_COLOR = True  # Player color the squares were measured with (robot on the rank 8 side)
+MODEL_TOLERANCE = 0.5  # Largest Kinematics.modelError, in squares, to trust the model off the measured squares
 # Format: "square": [servo0, servo1, servo2, servo3]
 square_angles = {
     "A8": [40, 165, 40, 170], "B8": [55, 155, 25, 170], "C8": [60, 150, 15, 160], "D8": [80, 140, 0, 150],
@@ -41,59 +56,146 @@ square_angles = {
     "D3": [92, 177, 47, 118], "C3": [84, 177, 47, 118], "B3": [75, 177, 50, 118], "A3": [70, 180, 50, 110]
 }
 
+def get_driver():
+    global driver
+    if driver is None:
+        driver = sd.PCA9685Driver()
+    return driver
+
+def set_driver(newDriver):
+    """Select the servo backend (e.g. ServoDriver.SimulatedDriver() for tests and benchmarks)."""
+    global driver
+    driver = newDriver
+
 # Method to move a servo slowly and smoothly to the target angle
-def move_servo_slowly(servo_num, target_angle):
+def move_servo_slowly(servo_num, target_angle, speed=1.0):
+    pose = [None] * len(current_angles)
+    pose[servo_num] = target_angle
+    return move_to_pose(pose, speed)
+
+# Method to move several servos together so that they all arrive at the same time
+def move_to_pose(target_pose, speed=1.0):
+    """
+    Move all joints to a target pose on a shared, velocity/acceleration limited timeline.
+
+    Args:
+        target_pose (list): Five target angles [S0, S1, S2, S3, S4]; None keeps that joint where it is.
+        speed (float): Fraction of the joint limits to use (1.0 = full speed).
+
+    Returns:
+        bool: True if the pose was reached.
+    """
     global current_angles
-    if not 0 <= target_angle <= 180:
-        print(f"Error: Target angle {target_angle} for servo {servo_num} must be between 0 and 180 degrees")
-        return
-
-    current_angle = current_angles[servo_num]
-    print(f"Moving servo {servo_num} (channel {servo_num+1}) from {current_angle} to {target_angle} degrees")
-
-    # Calculate the step direction and total steps
-    step = 1 if target_angle > current_angle else -1  # 1-degree steps
-    steps = int(abs(target_angle - current_angle))  # Number of 1-degree steps
-
-    # Move in increments of 1 degree
-    for i in range(steps + 1):
-        intermediate_angle = current_angle + (i * step)
-        if step > 0:
-            if intermediate_angle > target_angle:
-                intermediate_angle = target_angle
-        else:
-            if intermediate_angle < target_angle:
-                intermediate_angle = target_angle
-
-        try:
-            servos[servo_num].angle = intermediate_angle
-            print(f"Set servo {servo_num} (channel {servo_num+1}) to {intermediate_angle:.1f} degrees")
-            current_angles[servo_num] = intermediate_angle
-            time.sleep(0.04)  # Delay of 0.04 seconds for every 1-degree change
-        except Exception as e:
-            print(f"Error setting servo {servo_num} to {intermediate_angle:.1f} degrees: {e}")
-            return
-
-    # Ensure the final angle is exactly the target
-    if current_angles[servo_num] != target_angle:
-        try:
-            servos[servo_num].angle = target_angle
-            print(f"Set servo {servo_num} (channel {servo_num+1}) to {target_angle:.1f} degrees (final)")
-            current_angles[servo_num] = target_angle
-            time.sleep(0.04)
-        except Exception as e:
-            print(f"Error setting servo {servo_num} to {target_angle:.1f} degrees (final): {e}")
+    target = [current_angles[i] if a is None else a for i, a in enumerate(target_pose)]
+    for i, angle in enumerate(target):
+        if not 0 <= angle <= 180:
+            print(f"Error: Target angle {angle} for servo {i} must be between 0 and 180 degrees")
+            return False
+
+    servoDriver = get_driver()
+    tickTime = servoDriver.tick_period
+    trajectory = plan_pose_trajectory(current_angles, target, speed, tickTime)
+    print(f"Moving servos from {[round(a, 1) for a in current_angles]} to {[round(a, 1) for a in target]} in {len(trajectory) * tickTime:.2f} s")
+
+    return run_trajectory(trajectory)
+
+def run_trajectory(trajectory):
+    """
+    Play a sampled trajectory on the servo driver, one pose per control tick.
+
+    Args:
+        trajectory (list): Poses of five angles, e.g. from plan_pose_trajectory.
+
+    Returns:
+        bool: True if every pose was sent.
+    """
+    global current_angles
+    servoDriver = get_driver()
+    tickTime = servoDriver.tick_period
+
+    for pose in trajectory:
+        for i, angle in enumerate(pose):
+            if angle == current_angles[i]:
+                continue
+            try:
+                servoDriver.set_angle(i, angle)
+                current_angles[i] = angle
+            except Exception as e:
+                print(f"Error setting servo {i} to {angle:.1f} degrees: {e}")
+                return False
+        servoDriver.flush()  # All joint updates of this tick in one bus write
+        servoDriver.sleep(tickTime)
+
+    return True
+
+def profile_timing(start_pose, target_pose, speed=1.0):
+    """
+    Find the shortest shared trapezoidal profile that keeps every joint inside JOINT_LIMITS.
+
+    All joints follow the same normalized profile s(t) going from 0 to 1: constant
+    acceleration for ta seconds, cruise, and a symmetric deceleration ending at T.
+    The cruise speed is 1 / (T - ta), so joint i needs T - ta >= d_i / v_i and
+    ta * (T - ta) >= d_i / a_i. When the cruise phase vanishes the profile is triangular.
+
+    Args:
+        start_pose (list): Current angles of the servos.
+        target_pose (list): Target angles of the servos.
+        speed (float): Fraction of the joint limits to use.
+
+    Returns:
+        tuple: (T, ta) total time and acceleration time in seconds.
+    """
+    distances = np.abs(np.asarray(target_pose, dtype=float) - np.asarray(start_pose, dtype=float))
+    limits = np.asarray(JOINT_LIMITS, dtype=float)[:len(distances)]
+    cruise = (distances / (limits[:, 0] * speed)).max()
+    accel = (distances / (limits[:, 1] * speed ** 2)).max()
+    if accel == 0:
+        return (0.0, 0.0)
+
+    decelStart = max(cruise, np.sqrt(accel))
+    ta = accel / decelStart
+    return (decelStart + ta, ta)
+
+def plan_pose_trajectory(start_pose, target_pose, speed=1.0, tickTime=STEP_TIME):
+    """
+    Sample the shared trapezoidal profile from start_pose to target_pose once per control tick.
+
+    Args:
+        start_pose (list): Current angles of the servos.
+        target_pose (list): Target angles of the servos.
+        speed (float): Fraction of the joint limits to use.
+        tickTime (float): Control tick period in seconds.
+
+    Returns:
+        list: One list of angles per control tick, the last one equal to target_pose.
+    """
+    T, ta = profile_timing(start_pose, target_pose, speed)
+    if T == 0:
+        return []
+
+    start = np.asarray(start_pose, dtype=float)
+    delta = np.asarray(target_pose, dtype=float) - start
+    steps = int(np.ceil(T / tickTime))
+    t = np.arange(1, steps + 1) * (T / steps)
+
+    # Normalized trapezoid: accelerate, cruise, decelerate (monotonic, no overshoot)
+    vn = 1 / (T - ta)
+    an = vn / ta
+    s = np.where(t < ta, 0.5 * an * t ** 2,
+                 np.where(t <= T - ta, vn * (t - 0.5 * ta), 1 - 0.5 * an * (T - t) ** 2))
+
+    trajectory = start + np.outer(s, delta)
+    trajectory[-1] = target_pose
+    return trajectory.tolist()
 
 # Initialize all servos to their rest position
 def initialize_servos():
     print("Initializing all servos to rest position...")
-    angles_rest = [90, 90, 30, 90, 0]  # Rest position: [S0, S1, S2, S3, S4]
-    for i in [1, 2, 3, 0, 4]:  # Order: 1, 2, 3, 0, 4
-        move_servo_slowly(i, angles_rest[i])
+    move_to_pose(angles_rest)
 
 def move_to_position(target_square, params, color, goDown):
     """
-    Move the arm to the specified chessboard square using lookup table.
+    Move the arm to the specified chessboard square (or the graveyard "k0").
 
     Args:
         target_square (str): Chessboard square (e.g., "a1").
@@ -104,24 +206,100 @@ def move_to_position(target_square, params, color, goDown):
     Returns:
         bool: True if moved successfully.
     """
-    # Convert to uppercase for lookup (e.g., "a8" -> "A8")
-    target_square_upper = target_square.upper()
-
-    # Check if the square exists in the lookup table
-    if target_square_upper not in square_angles:
-        print(f"Error: Square {target_square} not found in the angle lookup table")
+    angles = square_pose(target_square, params, color, goDown)
+    if angles is None:
+        print(f"Error: Square {target_square} is out of reach of the arm")
         return False
 
-    # Get servo angles from the lookup table
-    angles = square_angles[target_square_upper]  # [servo0, servo1, servo2, servo3]
     print(f"Moving to {target_square} with angles (Servos 0-3): {[round(a, 1) for a in angles]}")
 
-    # Move servos in the specified order: 0, 3, 2, 1
-    servo_order = [0, 3, 2, 1]
-    for i in servo_order:
-        move_servo_slowly(i, angles[i])
-    
-    return True
+    # Move servos 0-3 together, the gripper keeps its state
+    return move_to_pose(angles + [None])
+
+def square_pose(square, params, color, goDown, level=kin.GRASP):
+    """
+    Servo 0-3 angles over a square, looked up in angle_table.
+
+    Args:
+        square (str): Chessboard square or "k0".
+        params (dict): Physical parameters.
+        color (bool): Player color.
+        goDown (float): Height adjustment for picking/placing.
+        level (int): Kinematics.GRASP or Kinematics.HOVER.
+
+    Returns:
+        list: Angles of servos 0-3, or None if the square is unreachable.
+    """
+    angles = angle_table(params, color, goDown)[kin.squareIndex(square), level]
+    if np.isnan(angles).any():
+        return None
+    return angles.tolist()
+
+def measured_angles(color):
+    """
+    square_angles for the player color, keyed by lowercase square names.
+
+    The angles belong to physical positions: with the other color the board is turned
+    around, so the same position is the mirrored square (a1 <-> h8). The graveyard
+    does not move.
+    """
+    measured = {}
+    for square, angles in square_angles.items():
+        square = square.lower()
+        if color != MEASURED_COLOR and square != "k0":
+            square = chr(ord('h') - ord(square[0]) + ord('a')) + str(9 - int(square[1]))
+        measured[square] = angles
+    return measured
+
+# Calibrated angle tables by (calibration, goDown)
+angle_tables = {}
+
+def angle_table(params, color, goDown):
+    """
+    Servo angles for every square and the graveyard at hover and grasp height.
+
+    The IK table is shifted by a thin-plate spline fitted on its error at the squares of
+    square_angles, and measured squares use their measured angles. Squares that were not
+    measured (and the graveyard) are only used if the arm model reproduces the measured
+    squares within MODEL_TOLERANCE, otherwise they are NaN and the move fails. Poses the
+    servos cannot reach (outside 0-180 degrees) are NaN as well, instead of an end stop;
+    at hover height, where only the clearance matters, the uncorrected IK pose is used then.
+
+    Returns:
+        numpy.ndarray: Array (65, 2, 4) indexed by [Kinematics.squareIndex, level, servo].
+    """
+    key = (tc.fingerprint(params, color, square_angles, kin.ARM_GEOMETRY, kin.SERVO_MAP), goDown)
+    table = angle_tables.get(key)
+    if table is not None:
+        return table
+
+    table = np.array(kin.angleTable(params, color, goDown))
+    error = kin.modelError(measured_angles(MEASURED_COLOR), params, MEASURED_COLOR, PICK_DEPTH * params["pieceHeight"])
+    if error > MODEL_TOLERANCE * params["sqSize"]:
+        print(f"Error: The arm model is {error:.2f} away from the measured squares, only measured squares can be reached")
+        table[:] = np.nan
+
+    ik = table.copy()
+    measured = measured_angles(color)
+    residuals = {}
+    for square, angles in measured.items():
+        if kin.squareIndex(square) == kin.GRAVEYARD:
+            continue
+        error = np.asarray(angles, dtype=float) - table[kin.squareIndex(square), kin.GRASP]
+        if not np.isnan(error).any():
+            residuals[square] = error
+    if len(residuals) >= 3:
+        table[:64] += cal.fitSurface(residuals, "tps")[:, None, :]
+    table[((table < 0) | (table > 180)).any(axis=-1)] = np.nan
+    hover = table[:, kin.HOVER]
+    hover[np.isnan(hover).any(axis=-1)] = ik[np.isnan(hover).any(axis=-1), kin.HOVER]
+    for square, angles in measured.items():
+        table[kin.squareIndex(square), kin.GRASP] = angles
+
+    if len(angle_tables) >= 8:
+        angle_tables.clear()
+    angle_tables[key] = table
+    return table
 
 def CBtoXY(targetCBsq, params, color):
     """
@@ -164,105 +342,278 @@ def executeMove(move, params, color, homography, cap, selectedCam):
         params (dict): Physical parameters.
         color (bool): Player color.
         homography: Homography matrix for vision.
-        cap: Camera capture object.
+        cap: Camera capture object (cv2.VideoCapture or CaptureService.CaptureService).
         selectedCam: Camera selection (for VisionModule).
 
     Returns:
         bool: True if move executed successfully.
     """
-    angles_rest = [90, 90, 30, 90, 0]  # Rest position
-    gClose = 10    # Gripper closed
-    gOpen = 25    # Gripper open
-    goDown = 0.6 * params["pieceHeight"]
-    gripState = gClose  # Start with gripper closed
-    x, y = 0, 0
+    steps = plan_move(move, params, color)
+    if steps is None:
+        return False
+
+    for label, trajectory in steps:
+        print(label)
+        if not run_trajectory(trajectory):
+            askPermision(homography, cap, selectedCam)
+            if not move_to_pose(trajectory[-1]):
+                return False
+
+    return True
+
+def plan_move(move, params, color, startPose=None):
+    """
+    Plan the whole arm motion of a square sequence without moving the arm.
+
+    Each pick opens the gripper, goes down and closes it; each place goes down and opens it.
+    Between squares the arm goes straight through hover height (cached trajectories) and it
+    only returns to rest at the end of the sequence.
+
+    Args:
+        move (str): Sequence of squares (e.g., "e7k0e2e7").
+        params (dict): Physical parameters.
+        color (bool): Player color.
+        startPose (list): Pose the arm starts from, current_angles by default.
+
+    Returns:
+        list: (label, trajectory) steps for run_trajectory, or None if a square is out of reach.
+    """
+    tickTime = get_driver().tick_period
+    pose = list(current_angles if startPose is None else startPose)
+    steps = []
+
+    def addPose(label, target_pose, speed=1.0):
+        nonlocal pose
+        target = [pose[i] if a is None else a for i, a in enumerate(target_pose)]
+        steps.append((label, plan_pose_trajectory(pose, target, speed, tickTime)))
+        pose = target
+
+    goDown = PICK_DEPTH * params["pieceHeight"]
+    lastSquare = None  # Square the arm is lowered on, None while at rest
 
     for i in range(0, len(move), 2):
-        # Calculate position
-        x0, y0 = x, y
-        x, y = CBtoXY((move[i], move[i+1]), params, color)
-        distance = sqrt(((x0 - x) ** 2) + ((y0 - y) ** 2))
+        target_square = move[i:i+2]
+        picking = (i // 2) % 2 == 0  # First square in pair
+
+        # Open the gripper before moving
+        if picking and pose[4] != gOpen:
+            addPose(f"OPEN the gripper (Servo 4 at {gOpen})", [None] * 4 + [gOpen])
+
+        # Go straight from the previous square through hover height instead of passing by rest
+        if lastSquare:
+            trajectory = square_trajectory(lastSquare, target_square, pose[4], params, color)
+            if trajectory is None:
+                print(f"Error: Square {target_square} is out of reach of the arm")
+                return None
+            steps.append((f"LIFT from {lastSquare} and MOVE TO {target_square}", trajectory[1:].tolist()))
+            pose = trajectory[-1].tolist()
+        else:
+            angles = square_pose(target_square, params, color, goDown)
+            if angles is None:
+                print(f"Error: Square {target_square} is out of reach of the arm")
+                return None
+            addPose(f"MOVE TO {target_square}", angles + [None])
+
+        if picking:
+            addPose(f"CLOSE the gripper (Servo 4 at {gClose})", [None] * 4 + [gClose], GRIP_SPEED)
+            goDown = PLACE_DEPTH * params["pieceHeight"]
+        else:
+            addPose(f"OPEN the gripper (Servo 4 at {gOpen})", [None] * 4 + [gOpen])
+            goDown = PICK_DEPTH * params["pieceHeight"]
+        lastSquare = target_square
+
+    # Return to rest position only once the whole turn is done
+    if lastSquare:
+        addPose("LIFT", plan_transfer(lastSquare, lastSquare, params, color)[0])
+    addPose("REST", angles_rest)
+    return steps
+
+def estimate_move_time(move, params, color, startPose=None):
+    """
+    Predict how long executeMove takes for a square sequence without sampling any trajectory.
+
+    Follows the same poses as plan_move (gripper, squares, hover transfers, rest) and adds
+    up the profile_timing durations, rounded up to whole control ticks like the sampling.
+
+    Args:
+        move (str): Sequence of squares (e.g., "e7k0e2e7").
+        params (dict): Physical parameters.
+        color (bool): Player color.
+        startPose (list): Pose the arm starts from, angles_rest by default.
+
+    Returns:
+        float: Execution time in seconds, or None if a square is out of reach.
+    """
+    tickTime = get_driver().tick_period if driver else STEP_TIME
+    pose = list(angles_rest if startPose is None else startPose)
+    total = 0.0
+
+    def addPose(target_pose, speed=1.0):
+        nonlocal pose, total
+        target = [pose[i] if a is None else a for i, a in enumerate(target_pose)]
+        T, _ = profile_timing(pose, target, speed)
+        total += np.ceil(T / tickTime) * tickTime
+        pose = target
+
+    goDown = PICK_DEPTH * params["pieceHeight"]
+    lastSquare = None
 
-        # Move to the square
+    for i in range(0, len(move), 2):
         target_square = move[i:i+2]
-        print(f"1) MOVE TO {target_square}")
-
-        # For picking (first square in pair, i.e., i/2 is even)
-        if (i / 2) % 2 == 0:
-            # Open the gripper before moving
-            print(f"1.1) OPEN the gripper (Servo 4 at {gOpen})")
-            move_servo_slowly(4, gOpen)
-            gripState = gOpen
-
-            # Move to the square
-            arrived = move_to_position(target_square, params, color, goDown)
-            askPermision(arrived, homography, cap, selectedCam)
-
-            # Close the gripper (Servo 4)
-            print(f"2) CLOSE the gripper (Servo 4 at {gClose})")
-            move_servo_slowly(4, gClose)
-
-            # Return to initial position in order 1, 2, 3, 0 (gripper remains closed)
-            print("3) RETURN TO INITIAL POSITION")
-            for servo_idx in [1, 2, 3, 0]:
-                move_servo_slowly(servo_idx, angles_rest[servo_idx])
-            gripState = gClose
-            goDown = 0.5 * params["pieceHeight"]
-
-        # For placing (second square in pair, i.e., i/2 is odd)
+        picking = (i // 2) % 2 == 0
+
+        if picking and pose[4] != gOpen:
+            addPose([None] * 4 + [gOpen])
+
+        angles = square_pose(target_square, params, color, goDown)
+        if angles is None:
+            return None
+        if lastSquare:
+            for waypoint in plan_transfer(lastSquare, target_square, params, color):
+                addPose(waypoint)
+        addPose(angles + [None])
+
+        if picking:
+            addPose([None] * 4 + [gClose], GRIP_SPEED)
+            goDown = PLACE_DEPTH * params["pieceHeight"]
         else:
-            arrived = move_to_position(target_square, params, color, goDown)
-            askPermision(arrived, homography, cap, selectedCam)
+            addPose([None] * 4 + [gOpen])
+            goDown = PICK_DEPTH * params["pieceHeight"]
+        lastSquare = target_square
 
-            # Open the gripper (Servo 4)
-            print(f"2) OPEN the gripper (Servo 4 at {gOpen})")
-            move_servo_slowly(4, gOpen)
-            gripState = gOpen
-            goDown = 0.6 * params["pieceHeight"]
+    if lastSquare:
+        addPose(plan_transfer(lastSquare, lastSquare, params, color)[0])
+    addPose(angles_rest)
+    return total
 
-    # Return to rest position
-    print("4) REST")
-    for i in [1, 2, 3, 0, 4]:  # Order: 1, 2, 3, 0, 4
-        move_servo_slowly(i, angles_rest[i])
+def calibration_fingerprint(params, color):
+    return tc.fingerprint(params, color, square_angles, JOINT_LIMITS, kin.ARM_GEOMETRY, kin.SERVO_MAP,
+                          kin.HOVER_PIECES, PICK_DEPTH, PLACE_DEPTH, get_driver().tick_rate)
 
-    return True
+def square_trajectory(fromSquare, toSquare, gripAngle, params, color):
+    """
+    Sampled trajectory from lowered on fromSquare to lowered on toSquare, cached per calibration.
 
-def askPermision(arrived, homography, cap, selectedCam):
+    Returns:
+        numpy.ndarray: Poses (float32) starting with the pose on fromSquare, or None if a square has no angles.
+    """
+    trajectory_cache.calibrate(calibration_fingerprint(params, color))
+    key = (fromSquare.lower(), toSquare.lower(), gripAngle)
+    trajectory = trajectory_cache.get(key)
+    if trajectory is None:
+        trajectory = plan_square_trajectory(fromSquare, toSquare, gripAngle, params, color)
+        if trajectory is None:
+            return None
+        trajectory_cache.put(key, trajectory)
+    return trajectory
+
+def plan_square_trajectory(fromSquare, toSquare, gripAngle, params, color):
+    # A closed gripper carries a piece from a pick to a place, an open one goes to the next pick
+    if gripAngle == gClose:
+        fromDepth, toDepth = PICK_DEPTH, PLACE_DEPTH
+    else:
+        fromDepth, toDepth = PLACE_DEPTH, PICK_DEPTH
+    fromAngles = square_pose(fromSquare, params, color, fromDepth * params["pieceHeight"])
+    toAngles = square_pose(toSquare, params, color, toDepth * params["pieceHeight"])
+    if fromAngles is None or toAngles is None:
+        return None
+
+    tickTime = get_driver().tick_period
+    pose = fromAngles + [gripAngle]
+    trajectory = [pose]
+    for waypoint in plan_transfer(fromSquare, toSquare, params, color) + [toAngles + [None]]:
+        target = [pose[i] if a is None else a for i, a in enumerate(waypoint)]
+        trajectory += plan_pose_trajectory(pose, target, tickTime=tickTime)
+        pose = target
+    return np.array(trajectory, dtype=np.float32)
+
+def precompute_trajectories(params, color, gripAngles=(gClose, gOpen)):
+    """
+    Fill trajectory_cache with every pair of squares and the graveyard (until the cache is full).
+    Several seconds of CPU (much more on a Pi): meant for an idle moment, games rely on
+    square_trajectory computing the pairs they use.
     """
-    Check if it is safe to move using vision module.
+    trajectory_cache.calibrate(calibration_fingerprint(params, color))
+    for fromSquare in kin.SQUARE_NAMES:
+        for toSquare in kin.SQUARE_NAMES:
+            for gripAngle in gripAngles:
+                if trajectory_cache.full():
+                    return
+                key = (fromSquare, toSquare, gripAngle)
+                if key not in trajectory_cache.entries:
+                    trajectory = plan_square_trajectory(fromSquare, toSquare, gripAngle, params, color)
+                    if trajectory is not None:
+                        trajectory_cache.put(key, trajectory)
+
+def load_trajectory_cache(params, color, path=TRAJECTORY_CACHE_FILE):
+    loaded = trajectory_cache.load(path, calibration_fingerprint(params, color))
+    print(f"Loaded {loaded} cached trajectories")
+
+def save_trajectory_cache(path=TRAJECTORY_CACHE_FILE, background=False):
+    """
+    Write the trajectory cache to disk if trajectories were added since it was loaded.
+
+    Args:
+        path (str): Cache file.
+        background (bool): Pickle on a separate thread, which is returned (None otherwise).
+    """
+    if not trajectory_cache.dirty:
+        return None
+    snapshot = trajectory_cache.snapshot()
+    if not background:
+        trajectory_cache.save(path, snapshot)
+        return None
+    # Not a daemon, so the file is complete even if the program exits meanwhile
+    thread = threading.Thread(target=trajectory_cache.save, args=(path, snapshot))
+    thread.start()
+    return thread
+
+def plan_transfer(fromSquare, toSquare, params, color):
+    """
+    Poses to go from a lowered square to above another one: lift to hover height in place,
+    then move over the next square at hover height.
+
+    Args:
+        fromSquare (str): Square the arm is lowered on.
+        toSquare (str): Next square, the final descent is done by move_to_position.
+        params (dict): Physical parameters.
+        color (bool): Player color.
+
+    Returns:
+        list: Poses for move_to_pose (the gripper keeps its state).
+    """
+    goDown = PICK_DEPTH * params["pieceHeight"]
+    poses = []
+    for square in (fromSquare, toSquare):
+        hover = square_pose(square, params, color, goDown, kin.HOVER)
+        poses.append((angles_rest[:4] if hover is None else hover) + [None])
+    return poses
+
+def askPermision(homography, cap, selectedCam):
+    """
+    Send the arm to rest after a failed move and wait (up to 3 s) for vision to report a clear board.
 
     Args:
-        arrived (bool): Whether the arm reached the position.
         homography: Homography matrix.
-        cap: Camera capture object.
+        cap: Camera capture object (cv2.VideoCapture or CaptureService.CaptureService).
         selectedCam: Camera selection.
     """
-    angles_rest = [90, 90, 30, 90, 0]
-    sec = 0
-
-    while not arrived:
-        print("Obstacle detected or move failed")
-        # Move to rest position
-        for i in [1, 2, 3, 0, 4]:
-            move_servo_slowly(i, angles_rest[i])
+    print("Obstacle detected or move failed")
+    move_to_pose(angles_rest)
 
-        while not arrived and sec < 3:
-            if vm.safetoMove(homography, cap, selectedCam) or sec == 2:
-                print("- Retrying")
-                arrived = move_to_position(target_square, params, color, goDown)
-            else:
-                print("Waiting for clear path...")
-                time.sleep(1)
-            sec += 1
+    for sec in range(3):
+        if vm.safetoMove(homography, cap, selectedCam):
+            break
+        print("Waiting for clear path...")
+        time.sleep(1)
+    print("- Retrying")
 
 def cleanup():
-    """Deinitialize PCA9685 on program exit."""
-    angles_rest = [90, 90, 30, 90, 0]
+    """Deinitialize the servo driver on program exit."""
     print("Returning to rest position before cleanup...")
-    for i in [1, 2, 3, 0, 4]:
-        move_servo_slowly(i, angles_rest[i])
-    pca.deinit()
-    print("PCA9685 deinitialized")
+    move_to_pose(angles_rest)
+    get_driver().deinit()
+    print("Servo driver deinitialized")
 
 # Initialize servos on startup
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import os
+import time
+import queue
+import itertools
+import threading
+
+AUDIO_PATH = 'audio'
+
+# Lower plays first when several cues are waiting
+PRIORITIES = {"checkmate": 0, "check": 1, "invalid_move": 1, "excuse": 1, "please": 1}
+DEFAULT_PRIORITY = 5
+
+class PygameBackend:
+    # One pygame mixer for the whole application, every cue decoded into a Sound up front
+    def __init__(self):
+        import pygame
+        self.pygame = pygame
+        pygame.mixer.init()
+
+    def load(self, path):
+        sounds = {}
+        for name in sorted(os.listdir(path)):
+            cue, ext = os.path.splitext(name)
+            if ext.lower() not in (".mp3", ".wav", ".ogg"):
+                continue
+            try:
+                sounds[cue] = self.pygame.mixer.Sound(os.path.join(path, name))
+            except self.pygame.error as e:
+                print(f"Error loading audio cue {name}: {e}")
+        return sounds
+
+    def play(self, sound):
+        channel = sound.play()
+        while channel is not None and channel.get_busy():
+            time.sleep(0.01)
+
+    def close(self):
+        self.pygame.mixer.quit()
+
+class NullBackend:
+    # Headless runs: cues are only recorded in `played`
+    def __init__(self):
+        self.played = []
+
+    def load(self, path):
+        if not os.path.isdir(path):
+            return {}
+        return {os.path.splitext(name)[0]: name for name in sorted(os.listdir(path))}
+
+    def play(self, sound):
+        self.played.append(sound)
+
+    def close(self):
+        pass
+
+class AudioService:
+    """
+    Audio cues played one after the other on a single worker thread.
+
+    The mixer is started once and every cue of the audio folder is decoded at start(),
+    so play() only puts the cue name in a bounded priority queue and returns. Cues that
+    arrive while another is playing (capture + check) wait for it instead of fighting
+    over the mixer; when the queue is full new cues are dropped. Without a working audio
+    device the NullBackend is used.
+    """
+    def __init__(self, path=AUDIO_PATH, backend=None, maxsize=8):
+        self.path = path
+        self.backend = backend
+        self.sounds = {}
+        self._queue = queue.PriorityQueue(maxsize)
+        self._order = itertools.count()  # Keeps the arrival order among equal priorities
+        self._thread = None
+
+    def start(self):
+        if self.backend is None:
+            try:
+                self.backend = PygameBackend()
+            except Exception as e:
+                print(f"Audio not available ({e}), cues disabled")
+                self.backend = NullBackend()
+        self.sounds = self.backend.load(self.path)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def play(self, cue, priority=None):
+        if cue not in self.sounds:
+            print(f"Error: Unknown audio cue {cue}")
+            return False
+        if priority is None:
+            priority = PRIORITIES.get(cue, DEFAULT_PRIORITY)
+        try:
+            self._queue.put_nowait((priority, next(self._order), cue))
+        except queue.Full:
+            return False
+        return True
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put((-1, -1, None))
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.backend.close()
+
+    def _run(self):
+        while True:
+            _, _, cue = self._queue.get()
+            if cue is None:
+                break
+            try:
+                self.backend.play(self.sounds[cue])
+            except Exception as e:
+                print(f"Error playing audio cue {cue}: {e}")
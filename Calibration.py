@@ -0,0 +1,74 @@
+import numpy as np
+
+# (file, rank) coordinates of the 64 squares, 0-based and ordered by square number (a1 = 0, h8 = 63)
+GRID = np.stack([np.arange(64) % 8, np.arange(64) // 8], axis=1).astype(float)
+
+def squareNumber(square):
+    return (ord(square[0].lower()) - 97) + 8 * (int(square[1]) - 1)
+
+def fitSurface(measured, method="tps", smoothing=0.0):
+    '''
+    Fit one 2-D interpolant per joint through a sparse set of measured squares and
+    evaluate it on the whole 8x8 board at once.
+
+    INPUT:
+        measured -> Dictionary {"a1": [servo0, servo1, ...], ...} with the angles measured on some squares.
+        method -> "tps" (thin-plate spline, any scattered squares, at least 3 not aligned) or
+                  "bilinear" (the measured squares must form a full grid of files x ranks).
+        smoothing -> Thin-plate spline regularization, 0 passes exactly through the measurements.
+    OUTPUT:
+        surface -> Array (64, joints) indexed by square number, so a lookup is surface[square].
+    '''
+    squares = list(measured)
+    points = GRID[[squareNumber(sq) for sq in squares]]
+    values = np.array([measured[sq] for sq in squares], dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+
+    if method == "bilinear":
+        return _bilinear(points, values)
+    if method == "tps":
+        return _thinPlate(points, values, smoothing)
+    raise ValueError(f"Unknown calibration method {method}")
+
+def _bilinear(points, values):
+    files = np.unique(points[:, 0])
+    ranks = np.unique(points[:, 1])
+    if len(files) < 2 or len(ranks) < 2 or len(points) != len(files) * len(ranks):
+        raise ValueError("Bilinear calibration needs a full grid of measured files x ranks")
+
+    knots = np.empty((len(files), len(ranks), values.shape[1]))
+    knots[np.searchsorted(files, points[:, 0]), np.searchsorted(ranks, points[:, 1])] = values
+
+    # Outside the measured range the nearest edge value is used
+    i, t = _segment(files, GRID[:, 0])
+    j, u = _segment(ranks, GRID[:, 1])
+    t = t[:, None]
+    u = u[:, None]
+    return ((1 - t) * (1 - u) * knots[i, j] + t * (1 - u) * knots[i + 1, j]
+            + (1 - t) * u * knots[i, j + 1] + t * u * knots[i + 1, j + 1])
+
+def _segment(knots, q):
+    i = np.clip(np.searchsorted(knots, q, side='right') - 1, 0, len(knots) - 2)
+    t = np.clip((q - knots[i]) / (knots[i + 1] - knots[i]), 0, 1)
+    return i, t
+
+def _tpsKernel(a, b):
+    r2 = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 0.5 * r2 * np.log(r2)  # r^2 log(r)
+    return np.nan_to_num(k)
+
+def _thinPlate(points, values, smoothing):
+    n = len(points)
+    P = np.hstack([np.ones((n, 1)), points])
+    A = np.zeros((n + 3, n + 3))
+    A[:n, :n] = _tpsKernel(points, points) + smoothing * np.eye(n)
+    A[:n, n:] = P
+    A[n:, :n] = P.T
+    b = np.zeros((n + 3, values.shape[1]))
+    b[:n] = values
+    coefs = np.linalg.lstsq(A, b, rcond=None)[0]
+
+    grid = np.hstack([np.ones((64, 1)), GRID])
+    return _tpsKernel(GRID, points) @ coefs[:n] + grid @ coefs[n:]
@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+import cv2
+import numpy as np
+
+class CaptureService:
+    """
+    Continuous camera capture on a background thread.
+
+    Frames are read straight into a small preallocated ring buffer, so the camera is
+    drained all the time and no consumer has to flush stale frames with grab(). Each
+    slot is stamped with the time its read started: as nothing queues up in the driver,
+    a frame stamped after t was exposed after t.
+
+    latest(), after() and read() return views into the ring, not copies. A view stays
+    valid for slots - 1 further frames (about 100 ms at 30 fps with 4 slots); copy the
+    frame if it has to be kept longer.
+    """
+    def __init__(self, source, slots=4):
+        self.source = source
+        self.frames = np.empty((slots,) + tuple(source.shape), dtype=np.uint8)
+        self.stamps = np.zeros(slots)
+        self.count = 0  # Frames captured so far, the latest one is in slot (count - 1) % slots
+        self.failures = 0
+        self._new = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def _run(self):
+        slots = len(self.frames)
+        while not self._stop.is_set():
+            slot = self.count % slots
+            stamp = time.monotonic()
+            if not self.source.read_into(self.frames[slot]):
+                self.failures += 1
+                time.sleep(0.01)
+                continue
+            with self._new:
+                self.stamps[slot] = stamp
+                self.count += 1
+                self._new.notify_all()
+
+    def _latest(self):
+        if not self.count:
+            return False, None, 0.0
+        slot = (self.count - 1) % len(self.frames)
+        return True, self.frames[slot], self.stamps[slot]
+
+    def latest(self):
+        """Newest frame, returns (ret, frame, timestamp) without waiting."""
+        with self._new:
+            return self._latest()
+
+    def after(self, timestamp, timeout=1.0):
+        """First frame exposed after timestamp (time.monotonic), returns (ret, frame, timestamp)."""
+        with self._new:
+            if not self._new.wait_for(lambda: self.count and self._latest()[2] > timestamp, timeout):
+                return False, None, 0.0
+            return self._latest()
+
+    def read(self, timeout=1.0):
+        """Same as cv2.VideoCapture.read(): (ret, frame) for a frame taken after the call."""
+        ret, frame, _ = self.after(time.monotonic(), timeout)
+        return ret, frame
+
+class OpenCVSource:
+    # cv2.VideoCapture (USB cameras or video files)
+    def __init__(self, cap):
+        self.cap = cap
+        self.shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+
+    def read_into(self, out):
+        if not self.cap.grab():
+            return False
+        ret, img = self.cap.retrieve(out)
+        if ret and img is not out:
+            if img.shape != out.shape:
+                img = cv2.resize(img, (out.shape[1], out.shape[0]))
+            out[...] = img
+        return ret
+
+class PiCameraSource:
+    # picamera.PiCamera, captured from the video port straight into the ring slot
+    def __init__(self, camera):
+        self.camera = camera
+        width, height = camera.resolution
+        self.shape = (height, width, 3)
+
+    def read_into(self, out):
+        try:
+            self.camera.capture(out, format="bgr", use_video_port=True)
+        except Exception as e:
+            print(f"Error capturing from the RPi camera: {e}")
+            return False
+        return True
+
+class FileCamera:
+    """
+    Fake camera replaying image files at a fixed frame rate, for tests without hardware.
+
+    paths is a list of image files or a directory (read in name order). The current
+    image is repeated on every frame until show() selects another one, or every
+    `hold` frames the next image is shown when hold is set.
+    """
+    def __init__(self, paths, fps=30, hold=None):
+        if isinstance(paths, str) and os.path.isdir(paths):
+            paths = [os.path.join(paths, name) for name in sorted(os.listdir(paths))]
+        self.images = [cv2.imread(path) for path in paths]
+        self.images = [img for img in self.images if img is not None]
+        if not self.images:
+            raise ValueError(f"No images found in {paths}")
+        self.shape = self.images[0].shape
+        self.period = 1.0 / fps
+        self.hold = hold
+        self.index = 0
+        self.frames = 0
+        self._next = time.monotonic()
+
+    def show(self, index):
+        self.index = index % len(self.images)
+
+    def read_into(self, out):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + self.period, time.monotonic())
+
+        img = self.images[self.index]
+        if img.shape != out.shape:
+            img = cv2.resize(img, (out.shape[1], out.shape[0]))
+        out[...] = img
+        self.frames += 1
+        if self.hold and self.frames % self.hold == 0:
+            self.show(self.index + 1)
+        return True
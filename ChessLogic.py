@@ -18,14 +18,23 @@ board.piece_type_at(chess.SQUARE_NAMES.index("e3")) == None
 
 #Modificar sistema de juego para en lugar de colocar la jugada, cologar un vector de casillas
 
+import time
 import chess
 import chess.engine
+import chess.polyglot
+from collections import OrderedDict
 
 def showCheck(board):
     if board.is_check():
         print("CHECK!!")
 
 def sequenceGenerator(uciMove, board):
+    '''
+    Cached through positionCache, see moveSequence for the details.
+    '''
+    return dict(positionCache.get(board).sequence(uciMove, board))
+
+def moveSequence(uciMove, board):
     '''
     INPUT: 
         uciMove -> Move in UCI format to analyze it. 
@@ -80,11 +89,135 @@ def sequenceGenerator(uciMove, board):
 
     return result
 
-def moveAnalysis (squares, board):
+def moveMask(move, board):
+    '''
+    INPUT:
+        move -> Legal chess.Move in board.
+        board -> Game state before the move.
+    OUTPUT:
+        mask -> Bitmask of the squares whose content changes with the move: from and to squares,
+                the rook squares when castling and the captured pawn when capturing en passant.
+    '''
+    mask = chess.BB_SQUARES[move.from_square] | chess.BB_SQUARES[move.to_square]
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if chess.square_file(move.to_square) > chess.square_file(move.from_square):
+            mask |= chess.BB_SQUARES[chess.square(7, rank)] | chess.BB_SQUARES[chess.square(5, rank)]
+        else:
+            mask |= chess.BB_SQUARES[chess.square(0, rank)] | chess.BB_SQUARES[chess.square(3, rank)]
+    elif board.is_en_passant(move):
+        mask |= chess.BB_SQUARES[chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))]
+    return mask
+
+def moveType(move, board):
+    if move.promotion:
+        return "Promotion"
+    if board.is_castling(move):
+        return "Castling"
+    if board.is_en_passant(move):
+        return "Passant"
+    if board.is_capture(move):
+        return "Capture"
+    return "Move"
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+class MoveIndex:
+    '''
+    Legal moves of one position keyed by the squares they change (moveMask), with their
+    type and the robot sequence of each move computed on first use.
+
+    An observed change mask that matches a move exactly is found with one dictionary
+    lookup. Otherwise (missing or extra noisy squares) every distinct mask is scored with
+    the overlap |observed & mask| / |observed | mask| and the best ones are returned.
+    Masks with the same score are told apart by the vision rank of the squares they
+    cover (the most changed square first, then the next one); if that still ties the
+    match is ambiguous and no move is returned. Promotions share the mask of their four
+    pieces.
+    '''
+    def __init__(self, board):
+        self.legalMoves = list(board.legal_moves)
+        self.masks = {}
+        self.types = {}
+        self.sequences = {}
+        for move in self.legalMoves:
+            self.masks.setdefault(moveMask(move, board), []).append(move)
+            self.types[move] = moveType(move, board)
+
+    def sequence(self, uciMove, board):
+        if uciMove not in self.sequences:
+            self.sequences[uciMove] = moveSequence(uciMove, board)
+        return self.sequences[uciMove]
+
+    def match(self, changed, order=()):
+        '''
+        INPUT:
+            changed -> Bitmask of the squares detected as changed by the vision.
+            order -> Changed squares (chess.Square) from the most to the least changed by the vision.
+        OUTPUT:
+            (moves, score) -> Legal moves that best explain the change and the match score, 1.0 for an exact match.
+                              moves is empty if the best masks tie on score and vision rank.
+        '''
+        moves = self.masks.get(changed)
+        if moves:
+            return moves, 1.0
+
+        best = []
+        bestKey = (0.0, 0)
+        for mask, moves in self.masks.items():
+            score = popcount(changed & mask) / popcount(changed | mask)
+            # Bit set for every covered square, the most changed one highest
+            rank = sum(1 << (len(order) - i) for i, square in enumerate(order) if mask & chess.BB_SQUARES[square])
+            key = (score, rank)
+            if key > bestKey:
+                best, bestKey = [mask], key
+            elif key == bestKey and score > 0:
+                best.append(mask)
+        if len(best) != 1:
+            return [], bestKey[0]
+        return self.masks[best[0]], bestKey[0]
+
+class PositionCache:
+    '''
+    Bounded LRU of MoveIndex objects keyed by the Zobrist hash of the position, so the
+    legal moves, move types, robot sequences and change masks of a position are only
+    computed once, also across retries, takebacks and replays.
+    '''
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, board):
+        key = chess.polyglot.zobrist_hash(board)
+        index = self.entries.get(key)
+        if index is None:
+            self.misses += 1
+            index = MoveIndex(board)
+            self.entries[key] = index
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return index
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+positionCache = PositionCache()
+
+def moveAnalysis (squares, board, minScore=0.5):
     '''
     INPUT: 
         squares -> Squares detected by the computer vision algorithm. 
         board -> State of game, this is a chess.Board() object.
+        minScore -> Lowest MoveIndex match score accepted as a move.
     OUTPUT:
         result -> Is empty if a valid move is not detected, or on the contrary, a dictionary data structure with two values:
             "move": String with the valid movement in UCI format, for example "e2e4".
@@ -95,54 +228,142 @@ def moveAnalysis (squares, board):
     '''
 
     result = {}  # Move type, move coordinates
-    kindOfMove = ""
-    uciMove = ""
 
     elements =  len(squares)
     if elements < 5 and elements > 1:  # Lenght verification
-        legalMoves = board.legal_moves
-
-        if elements == 4: # Clastling evaluation
-            if board.turn: # White Turn
-                if ("e1" in squares) and ("h1" in squares): # Queen side castling evaluation
-                    if chess.Move.from_uci("e1g1") in legalMoves:
-                        result["move"] = "e1g1"
-                        result["type"] = "Castling"
-                if ("e1" in squares) and ("a1" in squares): # Queen side castling evaluation
-                    if chess.Move.from_uci("e1c1") in legalMoves:
-                        result["move"] = "e1c1"
-                        result["type"] = "Castling"   
-            else: # Black Turn
-                if ("e8" in squares) and ("h8" in squares): # Queen side castling evaluation
-                    if chess.Move.from_uci("e8g8") in legalMoves:
-                        result["move"] = "e8g8"
-                        result["type"] = "Castling"
-                if ("e8" in squares) and ("a8" in squares): # Queen side castling evaluation
-                    if chess.Move.from_uci("e8c8") in legalMoves:
-                        result["move"] = "e8c8"
-                        result["type"] = "Castling" 
-        
-        if not result:
-            moveVector = [squares[0]+squares[1],squares[1]+squares[0]] # Instantiate the list with the two most probable movements
-            if elements > 2:
-                moveVector.append(squares[0]+squares[2])
-                moveVector.append(squares[2]+squares[0])
-                moveVector.append(squares[1]+squares[2])
-                moveVector.append(squares[2]+squares[1])
-            for uciMove in moveVector: # Move Validation
-                move = chess.Move.from_uci(uciMove)
-                if move in legalMoves:
-                    result["move"] = uciMove
-                    if board.is_en_passant(move):
-                        result["type"] = "Passant"
-                    elif board.is_capture(move):
-                        result["type"] = "Capture"
-                    else:
-                        result["type"] = "Move"             
-                    return result
-                elif chess.Move.from_uci(uciMove+"q") in legalMoves:
-                    result["move"] = uciMove
-                    result["type"] = "Promotion"
-                    return result
-
-    return result
\ No newline at end of file
+        order = [chess.parse_square(square) for square in squares]  # Most changed first
+        changed = 0
+        for square in order:
+            changed |= chess.BB_SQUARES[square]
+
+        index = positionCache.get(board)
+        moves, score = index.match(changed, order)
+        if moves and score >= minScore:
+            move = moves[0]
+            result["move"] = move.uci()[:4]
+            result["type"] = index.types[move]
+
+    return result
+
+def armAwareMove(engine, board, limit, moveCost, multipv=4, window=50):
+    '''
+    Pick the cheapest move to execute that is not stronger than the engine's own choice.
+
+    One MultiPV search is run: its bestmove is the move the engine plays at its Skill
+    Level (which only affects bestmove, the MultiPV lines are full strength). The
+    candidates are that move and the lines scored at most window centipawns below it,
+    never above it, so the arm does not undo the Skill Level.
+
+    INPUT:
+        engine -> chess.engine.SimpleEngine or EngineService.
+        board -> Game state.
+        limit -> chess.engine.Limit of the search.
+        moveCost -> Function of a robot sequence ("e7k0e2e7") returning its execution time in seconds,
+                    None if the arm cannot do it.
+        multipv -> Number of candidate moves searched.
+        window -> Centipawns below the engine's move a candidate may be.
+    OUTPUT:
+        result -> chess.engine.PlayResult of the chosen move, result.info["armTime"] is its predicted time.
+    '''
+    with engine.analysis(board, limit, multipv=multipv) as analysis:
+        best = analysis.wait()
+        infos = analysis.multipv
+    if best.move is None:
+        return engine.play(board, limit)
+
+    lines = {info["pv"][0]: info for info in infos if info.get("pv") and "score" in info}
+    played = lines.get(best.move, {"pv": [best.move] + ([best.ponder] if best.ponder else [])})
+    scored = [(0, played)]
+    if "score" in played:
+        anchor = played["score"].relative.score(mate_score=100000)
+        for move, info in lines.items():
+            loss = anchor - info["score"].relative.score(mate_score=100000)
+            if move != best.move and 0 <= loss <= window:
+                scored.append((loss, info))
+
+    candidates = []
+    for loss, info in scored:
+        cost = moveCost(sequenceGenerator(info["pv"][0].uci(), board)["seq"])
+        if cost is not None:
+            candidates.append((cost, loss, info))
+    if not candidates:
+        candidates = [(None, 0, played)]
+
+    cost, loss, info = min(candidates, key=lambda candidate: (candidate[0] or 0, candidate[1]))
+    info = dict(info)
+    info["armTime"] = cost
+    pv = info["pv"]
+    return chess.engine.PlayResult(pv[0], pv[1] if len(pv) > 1 else None, info)
+
+class Ponderer:
+    '''
+    Engine search during the human's turn.
+
+    After the robot moves, start() analyses (infinite search) the position after the
+    reply the engine expects (PlayResult.ponder). When the human plays that move, reply()
+    uses the search that has been running all along, waiting only for what is left of
+    the time limit; otherwise the analysis is stopped and a normal search is done. With
+    reuse=False (reduced Skill Level, which only applies to "bestmove") a ponder hit
+    still plays a short search on the warm hash instead of the full-strength PV.
+    '''
+    def __init__(self, engine, warmTime=0.1):
+        self.engine = engine
+        self.warmTime = warmTime  # Search time after a ponder hit when the PV cannot be reused
+        self.analysis = None
+        self.board = None
+        self.started = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, board, move):
+        '''
+        INPUT:
+            board -> Game state after the robot move.
+            move -> Expected human reply, PlayResult.ponder of the robot move.
+        '''
+        self.stop()
+        if move is None or move not in board.legal_moves:
+            return
+        self.board = board.copy()
+        self.board.push(move)
+        self.started = time.time()
+        self.analysis = self.engine.analysis(self.board)
+
+    def stop(self):
+        if self.analysis is not None:
+            self.analysis.stop()
+        self.analysis = None
+
+    def reply(self, board, limit, reuse=True):
+        '''
+        INPUT:
+            board -> Game state after the human move.
+            limit -> chess.engine.Limit of the robot move.
+            reuse -> Play the ponder PV directly on a hit (full strength engines).
+        OUTPUT:
+            result -> chess.engine.PlayResult, result.info["depth"] is the depth reached and
+                      result.info["ponderhit"] tells if the ponder search was used.
+        '''
+        hit = self.analysis is not None and chess.polyglot.zobrist_hash(board) == chess.polyglot.zobrist_hash(self.board)
+        if not hit:
+            if self.analysis is not None:
+                self.misses += 1
+            self.stop()
+            result = self.engine.play(board, limit, info=chess.engine.INFO_BASIC)
+            result.info["ponderhit"] = False
+            return result
+
+        self.hits += 1
+        remaining = (limit.time or 0) - (time.time() - self.started)
+        if reuse and remaining > 0:
+            time.sleep(remaining)  # Continue the search up to the time limit
+        info = dict(self.analysis.info)
+        self.stop()
+        pv = info.get("pv")
+        if reuse and pv and pv[0] in board.legal_moves:
+            result = chess.engine.PlayResult(pv[0], pv[1] if len(pv) > 1 else None, info)
+        else:
+            result = self.engine.play(board, chess.engine.Limit(time=self.warmTime), info=chess.engine.INFO_BASIC)
+            result.info["ponderDepth"] = info.get("depth")
+        result.info["ponderhit"] = True
+        return result
@@ -0,0 +1,166 @@
+import queue
+import threading
+import concurrent.futures
+import chess.engine
+
+# Engine options applied to every game on top of the Skill Level
+ENGINE_OPTIONS = {"Hash": 64, "Threads": 2}
+
+class EngineService:
+    """
+    Long-lived UCI engine shared by the whole application.
+
+    The engine process is started once, on the service thread, so launching it runs in
+    parallel with the rest of the setup. Callers on any thread send requests (play,
+    analyse, analysis, configure) through a queue and wait for the result; the service
+    thread runs them one by one. While the queue is idle the engine is pinged every
+    healthInterval seconds, and a crashed engine is restarted with the last options
+    (a request that hit the crash is retried once). No ping is sent while a background
+    analysis is running, the engine would stop it to answer.
+    """
+    def __init__(self, command, healthInterval=5.0, timeout=10.0):
+        self.command = command
+        self.healthInterval = healthInterval
+        self.timeout = timeout  # Seconds the health check waits for the engine
+        self.options = {}
+        self.engine = None
+        self.restarts = 0
+        self._requests = queue.Queue()
+        self._thread = None
+        self._analysisDone = None  # Event of the last background analysis, set once it finished
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    # Requests
+    def submit(self, name, *args, **kwargs):
+        """Queue engine.name(*args, **kwargs), returns a concurrent.futures.Future."""
+        future = concurrent.futures.Future()
+        self._requests.put((name, args, kwargs, future))
+        return future
+
+    def call(self, name, *args, **kwargs):
+        return self.submit(name, *args, **kwargs).result()
+
+    def play(self, board, limit, **kwargs):
+        return self.call("play", board, limit, **kwargs)
+
+    def analyse(self, board, limit, **kwargs):
+        return self.call("analyse", board, limit, **kwargs)
+
+    def analysis(self, board, limit=None, **kwargs):
+        # Background analysis, the returned object can be stopped from any thread
+        return self.call("analysis", board, limit, **kwargs)
+
+    def configure(self, options):
+        """Options for the next games, only the ones the engine supports are sent."""
+        self.options.update(options)
+        return self.call("configure", options)
+
+    def quit(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+
+    # Service thread
+    def _open(self):
+        if self.engine is not None:
+            try:
+                self.engine.close()
+            except Exception:
+                pass
+        self.engine = chess.engine.SimpleEngine.popen_uci(self.command, timeout=self.timeout)
+        supported = {name: value for name, value in self.options.items() if name in self.engine.options}
+        if supported:
+            self.engine.configure(supported)
+
+    def restart(self):
+        print("Engine not responding, restarting it")
+        self.restarts += 1
+        self._open()
+
+    def _execute(self, name, args, kwargs):
+        if name == "configure":
+            options = {key: value for key, value in args[0].items() if key in self.engine.options}
+            return self.engine.configure(options)
+        result = getattr(self.engine, name)(*args, **kwargs)
+        if name == "analysis":
+            self._track(result)
+        return result
+
+    def _track(self, analysis):
+        # Wait for the analysis on its own thread, it finishes when stopped, at its limit or on a crash
+        done = threading.Event()
+        def wait():
+            try:
+                analysis.wait()
+            except Exception:
+                pass
+            done.set()
+        threading.Thread(target=wait, daemon=True).start()
+        self._analysisDone = done
+
+    def _analysing(self):
+        return self._analysisDone is not None and not self._analysisDone.is_set()
+
+    def _healthy(self):
+        try:
+            self.engine.ping()
+            return True
+        except (chess.engine.EngineTerminatedError, chess.engine.EngineError, concurrent.futures.TimeoutError):
+            return False
+
+    def _run(self):
+        try:
+            self._open()
+        except Exception as e:
+            print(f"Error starting the chess engine {self.command}: {e}")
+
+        while True:
+            try:
+                request = self._requests.get(timeout=self.healthInterval)
+            except queue.Empty:
+                if self.engine is not None and self._analysing():
+                    continue
+                if self.engine is None or not self._healthy():
+                    self._tryRestart()
+                continue
+            if request is None:
+                break
+
+            name, args, kwargs, future = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            for attempt in range(2):
+                try:
+                    if self.engine is None:
+                        raise chess.engine.EngineTerminatedError("engine not running")
+                    future.set_result(self._execute(name, args, kwargs))
+                    break
+                except chess.engine.EngineTerminatedError as e:
+                    if attempt or not self._tryRestart():
+                        future.set_exception(e)
+                        break
+                except Exception as e:
+                    future.set_exception(e)
+                    break
+
+        if self.engine is not None:
+            try:
+                self.engine.quit()
+            except Exception:
+                self.engine.close()
+            self.engine = None
+
+    def _tryRestart(self):
+        try:
+            self.restart()
+            return True
+        except Exception as e:
+            print(f"Error restarting the chess engine: {e}")
+            self.engine = None
+            return False
@@ -0,0 +1,120 @@
+import time
+import chess
+import chess.engine
+
+INCREMENT = "increment"  # Fischer: increment added after every move
+DELAY = "delay"          # Simple delay: the clock only starts after `increment` seconds
+BRONSTEIN = "bronstein"  # The time used is given back after the move, up to `increment`
+
+MOTION_TIME = 12.0  # Seconds of arm motion per move assumed when no estimate is given
+MOVES_TO_GO = 40    # Moves the motion reserve covers at the start of the game
+MIN_MOVES_TO_GO = 10
+
+class GameClock:
+    """
+    Chess clock for both sides, driven by the game events.
+
+    press(color) ends the turn of color and starts the other side, like hitting the
+    clock: Interface presses it when the human move is detected and when the arm has
+    finished the robot move. The robot turn is split in thinking and motion by
+    motion(), so turns[] records (color, thinking, motion) seconds for every move.
+    Arm motion counts against the robot clock, as moving the pieces does for a human.
+    """
+    def __init__(self, initial=600, increment=0, mode=INCREMENT, clock=time.monotonic, motionTime=MOTION_TIME):
+        self.initial = initial
+        self.increment = increment
+        self.mode = mode
+        self.clock = clock
+        self.motionTime = motionTime  # Estimated arm motion per move, used until moves are measured
+        self.remaining = {chess.WHITE: float(initial), chess.BLACK: float(initial)}
+        self.running = None  # Color whose clock is running
+        self.turnStart = 0.0
+        self.motionStart = None  # Start of the arm motion in the current turn
+        self.turns = []
+
+    def start(self, color):
+        self.running = color
+        self.turnStart = self.clock()
+        self.motionStart = None
+
+    def stop(self):
+        if self.running is not None:
+            self.remaining[self.running] = self.left(self.running)
+        self.running = None
+
+    def _used(self, now):
+        # Clock time used in the current turn, after the delay in simple delay mode
+        used = now - self.turnStart
+        if self.mode == DELAY:
+            used = max(used - self.increment, 0.0)
+        return used
+
+    def left(self, color):
+        if color != self.running:
+            return self.remaining[color]
+        return self.remaining[color] - self._used(self.clock())
+
+    def flagged(self, color):
+        return self.left(color) <= 0
+
+    def motion(self):
+        # The arm starts executing the move of the running side
+        self.motionStart = self.clock()
+
+    def press(self, color):
+        """End the turn of color and start the clock of the other side."""
+        now = self.clock()
+        if self.running == color:
+            used = self._used(now)
+            self.remaining[color] -= used
+            if self.mode == INCREMENT:
+                self.remaining[color] += self.increment
+            elif self.mode == BRONSTEIN:
+                self.remaining[color] += min(used, self.increment)
+
+            elapsed = now - self.turnStart
+            moving = now - self.motionStart if self.motionStart is not None else 0.0
+            self.turns.append((color, elapsed - moving, moving))
+        self.start(not color)
+
+    def motionPerMove(self, color):
+        # Average arm motion of the moves of color, motionTime before the first one
+        moving = [turn[2] for turn in self.turns if turn[0] == color and turn[2] > 0]
+        return sum(moving) / len(moving) if moving else self.motionTime
+
+    def limit(self, robot=None):
+        """
+        chess.engine.Limit with both clocks so the engine manages its own time. UCI has no
+        delay field, in the delay modes the delay is passed as increment.
+
+        The engine does not know the arm motion charged to the robot clock, so for the
+        robot color the motion of every move (motionPerMove) is taken off its increment, and what the
+        increment does not cover is reserved on its clock for the moves still to play
+        (MOVES_TO_GO less the moves made, at least MIN_MOVES_TO_GO).
+        """
+        clocks = {color: max(self.left(color), 0.0) for color in (chess.WHITE, chess.BLACK)}
+        increments = {chess.WHITE: self.increment, chess.BLACK: self.increment}
+        if robot is not None:
+            motion = self.motionPerMove(robot)
+            played = sum(1 for turn in self.turns if turn[0] == robot)
+            movesToGo = max(MOVES_TO_GO - played, MIN_MOVES_TO_GO)
+            clocks[robot] = max(clocks[robot] - max(motion - self.increment, 0.0) * movesToGo, 0.0)
+            increments[robot] = max(self.increment - motion, 0.0)
+        return chess.engine.Limit(white_clock=clocks[chess.WHITE], black_clock=clocks[chess.BLACK],
+                                  white_inc=increments[chess.WHITE], black_inc=increments[chess.BLACK])
+
+    def moveBudget(self):
+        # Typical seconds per move of this time control (40 moves plus the increment)
+        return round(self.initial / 40 + self.increment, 1)
+
+    def summary(self, color):
+        """(thinking, motion) seconds spent by color over the game."""
+        thinking = sum(turn[1] for turn in self.turns if turn[0] == color)
+        moving = sum(turn[2] for turn in self.turns if turn[0] == color)
+        return thinking, moving
+
+def formatTime(seconds):
+    seconds = max(seconds, 0)
+    if seconds < 10:
+        return f"{int(seconds // 60)}:{seconds % 60:04.1f}"
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
@@ -0,0 +1,486 @@
+import json
+import time
+import queue
+import argparse
+import threading
+import cv2
+import ChessLogic as cl
+import VisionModule as vm
+import ArmControl as ac
+import MotionExecutor as me
+import EngineService as es
+import MoveBook as mb
+import GameClock as gc
+import AudioService as au
+import CaptureService as cs
+
+ARM_AWARE_SKILL = 14  # Up to this Skill Level the robot prefers moves that are quick to execute
+EVAL_WINDOW = 50  # Centipawns a quicker move may lose against the engine's Skill Level move
+TIME_CONTROLS = {"Untimed": None, "5+3": (300, 3, gc.INCREMENT), "10+5": (600, 5, gc.INCREMENT),
+                 "15+10": (900, 10, gc.INCREMENT), "10 delay 5": (600, 5, gc.DELAY), "10 Bronstein 5": (600, 5, gc.BRONSTEIN)}
+SIDE_ANGLES = {"1-2": 90, "2-3": 180, "4-3": -90, "1-4": 0}  # Quadrants of the white side -> findRotation angle
+SEQUENCE_CUES = {"White Queen Side Castling": "q_castling", "Black Queen Side Castling": "q_castling",
+                 "White King Side Castling": "k_castling", "Black King Side Castling": "k_castling",
+                 "Capture": "capture", "Passant": "passant", "Promotion": "promotion"}
+TICK = 0.2  # Seconds between clock updates
+
+class GameController:
+    """
+    The game state machine, independent of any GUI.
+
+    Input events are posted to a queue with post(event, **data) and handled one at a
+    time on the controller thread:
+        newGame, promotion (piece), quit
+    plus the internal engineReady, moveSettled (from the camera thread) and
+    robotDone / robotFailed (from the robot move thread). Nothing is polled: the camera
+    thread waits for new frames and the controller thread for events.
+
+    Every listener registered with subscribe() is called as listener(event, data) with:
+        gameStarted (board), gameMessage (text), robotMessage (text), board (board, sequence),
+        clock (white, black), promotion, gameOver (result, robotWins), error (text)
+    Listeners are called from the controller and worker threads, so a GUI has to hand
+    the events over to its own thread (e.g. window.write_event_value).
+    """
+    def __init__(self, engineService, moveBook, audio, motionExecutor, params):
+        self.engineService = engineService
+        self.moveBook = moveBook
+        self.audio = audio
+        self.motionExecutor = motionExecutor
+        self.params = params
+        self.autoPromotion = None  # Piece promoted to without asking (headless runs), e.g. "q"
+        self.listeners = []
+        self.state = "stby"
+        self.playing = False
+        self.game = 0  # Incremented on every new game, robot results of older games are ignored
+        self.board = cl.chess.Board()
+        self.camera = None
+        self.ponderer = cl.Ponderer(engineService)
+        self.gameClock = None
+        self.pending = None  # Human promotion waiting for the piece
+        self._events = queue.Queue()
+        self._thread = None
+        self._detectStop = threading.Event()
+        self._detectLock = threading.Lock()
+        self._motionLock = threading.Lock()  # Submitting a robot move against ending the game
+
+    # Front end interface
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event, **data):
+        for listener in self.listeners:
+            listener(event, data)
+
+    def post(self, event, **data):
+        self._events.put((event, data))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.post("quit")
+            self.post("stop")
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        handlers = {"newGame": self._newGame, "engineReady": self._engineReady, "moveSettled": self._moveSettled,
+                    "promotion": self._promotion, "robotDone": self._robotDone, "robotFailed": self._robotFailed,
+                    "quit": self._quit}
+        lastTick = time.monotonic()
+        while True:
+            try:
+                event, data = self._events.get(timeout=TICK)
+            except queue.Empty:
+                event, data = None, {}
+            if event == "stop":
+                break
+            try:
+                if event:
+                    handlers[event](**data)
+                if time.monotonic() - lastTick >= TICK:
+                    lastTick = time.monotonic()
+                    self._tick()
+            except Exception as e:
+                print(f"Error handling {event}: {e}")
+                self.emit("error", text=str(e))
+
+    # Game start
+    def _newGame(self, camera, homography, rotMat, emptyIMG, startIMG, playerColor, skillLevel, timeControl, fen=""):
+        self._detectStop.set()
+        self.camera = camera
+        self.homography = homography
+        self.rotMat = rotMat
+        self.playerColor = playerColor
+        self.skillLevel = skillLevel
+        self.board = cl.chess.Board(fen) if fen else cl.chess.Board()
+
+        self.boardWarp = vm.BoardWarp(homography, rotMat)
+        self.boardClassifier = vm.BoardClassifier(self.boardWarp.apply(emptyIMG))
+        self.prevIMG = startIMG.copy()
+        self.curIMG = None
+        self.boardClassifier.calibrate(self.prevIMG, self.board.occupied, self.board.occupied_co[cl.chess.WHITE])
+        self.moveDetector = vm.MoveDetector(homography, rotMat, playerColor)
+
+        ac.load_trajectory_cache(self.params, playerColor)  # Missing trajectories are planned when first used
+        self.gameClock = None
+        if TIME_CONTROLS.get(timeControl):
+            self.gameClock = gc.GameClock(*TIME_CONTROLS[timeControl], motionTime=self.typicalMoveTime())
+            self.gameClock.start(self.board.turn)
+
+        self.game += 1
+        self.playing = True
+        self.state = "stby"
+        self.emit("gameStarted", board=self.board.copy())
+        self.emit("robotMessage", text="Good Luck!")
+        self.emit("gameMessage", text="--")
+        self.audio.play("good_luck")
+        threading.Thread(target=self._startEngine, daemon=True).start()
+
+        self._detectStop = threading.Event()
+        threading.Thread(target=self._detect, args=(self._detectStop,), daemon=True).start()
+
+    def _startEngine(self):
+        self.engineService.configure({"Skill Level": self.skillLevel, **es.ENGINE_OPTIONS})
+        self.post("engineReady")
+
+    def _engineReady(self):
+        if not self.playing:
+            return
+        if self.playerColor == self.board.turn:
+            self.state = "playerTurn"
+        else:
+            self._startRobotTurn()
+
+    # Human move
+    def _detect(self, stop):
+        # Camera thread: feeds every new frame to the move detector during the human's turn
+        stamp = 0.0
+        while not stop.is_set():
+            ret, frame, frameStamp = self.camera.after(stamp, timeout=0.5)
+            if not ret:
+                continue
+            stamp = frameStamp
+            if self.state != "playerTurn":
+                continue
+            with self._detectLock:
+                settled = self.moveDetector.feed(frame, stamp)
+            if settled:
+                self.post("moveSettled", frame=frame.copy())
+
+    def _moveSettled(self, frame):
+        if self.state != "playerTurn":
+            return
+        print("Debug: Board settled after a move, analysing the frame...")
+        self.curIMG = self.boardWarp.apply(frame, self.curIMG)
+        cv2.imwrite("debug_prevIMG.png", self.prevIMG)
+        cv2.imwrite("debug_curIMG.png", self.curIMG)
+        squares, _ = vm.findMoves(self.prevIMG, self.curIMG)
+        print(f"Debug: Move detection complete, squares changed: {squares}")
+        result = cl.moveAnalysis(squares, self.board)
+        if not result:
+            print("Debug: Invalid move detected, staying in playerTurn")
+            self.emit("gameMessage", text="Invalid move!")
+            self.audio.play("invalid_move")
+            return
+
+        if result["type"] == "Promotion":
+            if not self.autoPromotion:
+                self.pending = result
+                self.state = "promotion"
+                self.emit("promotion")
+                return
+            result["move"] += self.autoPromotion
+        self._playerMove(result)
+
+    def _promotion(self, piece):
+        if self.state != "promotion":
+            return
+        if not piece:
+            self.emit("promotion")
+            return
+        result = self.pending
+        self.pending = None
+        result["move"] += piece
+        self._playerMove(result)
+
+    def _playerMove(self, result):
+        sequence = cl.sequenceGenerator(result["move"], self.board)
+        self.emit("gameMessage", text=sequence["type"])
+        self.board.push_uci(result["move"])
+        self.emit("board", board=self.board.copy(), sequence=sequence)
+        self.checkBoard(self.curIMG)
+        if self.gameClock:
+            self.gameClock.press(self.playerColor)
+        if self.board.is_game_over():
+            self._gameOver()
+            return
+        self._startRobotTurn()
+
+    # Robot move
+    def _startRobotTurn(self):
+        self.state = "pcTurn"
+        threading.Thread(target=self._robotTurn, args=(self.board.copy(), self.game), daemon=True).start()
+
+    def _robotTurn(self, board, game):
+        # Worker thread: search and arm motion, the result goes back to the controller as an event
+        try:
+            pcMove, sequence = self._searchMove(board)
+            watcher = vm.BoardWatcher(self.camera.read, self.homography, self.rotMat, self.motionExecutor.pause,
+                                      self.motionExecutor.resume, self.playerColor)
+            watcher.ignore([sequence["seq"][i:i+2] for i in range(0, len(sequence["seq"]), 2)])
+            watcher.start()
+            try:
+                with self._motionLock:
+                    # The game may have ended during the search, cancel() only stops moves already submitted
+                    if not self.playing or game != self.game:
+                        return
+                    if self.gameClock:
+                        self.gameClock.motion()
+                    armMove = self.motionExecutor.submit(self.motionExecutor.execute_move(sequence["seq"], self.params, self.playerColor, self._armProgress))
+                if not armMove.result():
+                    self.post("robotFailed", text="Can't reach!", game=game)
+                    return
+            finally:
+                watcher.stop()
+        except me.MotionCancelled:
+            return
+        except Exception as e:
+            print(f"Error in the robot turn: {e}")
+            self.post("robotFailed", text=str(e), game=game)
+            return
+        self.post("robotDone", move=pcMove, sequence=sequence, game=game)
+
+    def _searchMove(self, board):
+        start = time.time()
+        limit = self.gameClock.limit(not self.playerColor) if self.gameClock else cl.chess.engine.Limit(time=1)
+        cacheLimit = cl.chess.engine.Limit(time=self.gameClock.moveBudget() if self.gameClock else 1)  # Same key for the whole game
+        pcMove = self.moveBook.lookup(board, self.skillLevel, cacheLimit)
+        if pcMove is not None:
+            self.ponderer.stop()
+            print(f"Debug: {pcMove.info['source']} move {pcMove.move}, {self.moveBook.stats()}")
+        elif self.skillLevel <= ARM_AWARE_SKILL:
+            self.ponderer.stop()
+            pcMove = cl.armAwareMove(self.engineService, board, limit, self.moveTime, window=EVAL_WINDOW)
+            print(f"Debug: Engine move {pcMove.move} in {time.time() - start:.2f} s, arm time {pcMove.info['armTime']} s")
+        else:
+            pcMove = self.ponderer.reply(board, limit, reuse=self.skillLevel >= 20)
+            print(f"Debug: Engine move {pcMove.move} in {time.time() - start:.2f} s, depth {pcMove.info.get('depth')}, ponder hit {pcMove.info['ponderhit']}")
+        self.moveBook.store(board, self.skillLevel, cacheLimit, pcMove)
+
+        sequence = cl.sequenceGenerator(pcMove.move.uci(), board)
+        self.emit("gameMessage", text=sequence["type"])
+        if sequence["type"] in SEQUENCE_CUES:
+            self.audio.play(SEQUENCE_CUES[sequence["type"]])
+        return pcMove, sequence
+
+    def moveTime(self, seq):
+        return ac.estimate_move_time(seq, self.params, self.playerColor)
+
+    def typicalMoveTime(self):
+        # Mean estimated arm time of the robot's legal moves in the starting position, seeds the clock's motion reserve
+        board = self.board.copy(stack=False)
+        board.turn = not self.playerColor
+        times = [self.moveTime(cl.sequenceGenerator(move.uci(), board)["seq"]) for move in board.legal_moves]
+        times = [t for t in times if t is not None]
+        return sum(times) / len(times) if times else gc.MOTION_TIME
+
+    def _armProgress(self, done, total):
+        # Called on every control tick by the motion executor, only report every 10%
+        if done * 10 // total != (done - 1) * 10 // total:
+            self.emit("robotMessage", text=f"Moving {100 * done // total}%")
+
+    def _robotDone(self, move, sequence, game):
+        if self.state != "pcTurn" or game != self.game or move.move not in self.board.legal_moves:
+            return
+        if self.gameClock:
+            self.gameClock.press(self.board.turn)
+        self.board.push(move.move)
+        self.emit("board", board=self.board.copy(), sequence=sequence)
+        if self.board.is_checkmate():
+            self.emit("robotMessage", text="CHECKMATE!")
+            self.audio.play("checkmate")
+        elif self.board.is_check():
+            self.emit("robotMessage", text="CHECK!")
+            self.audio.play("check")
+        else:
+            self.emit("robotMessage", text="---")
+        if self.board.is_game_over():
+            self._gameOver()
+            return
+        if self.skillLevel > ARM_AWARE_SKILL:
+            self.ponderer.start(self.board, move.ponder)  # Only the Ponderer.reply path of _searchMove uses it
+
+        # New reference for the human move
+        ret, frame = self.camera.read()
+        if ret:
+            self.prevIMG = self.boardWarp.apply(frame, self.prevIMG)
+            with self._detectLock:
+                self.moveDetector.reset(frame)
+            self.checkBoard(self.prevIMG)
+        self.state = "playerTurn"
+
+    def _robotFailed(self, text, game):
+        if game != self.game:
+            return
+        self.emit("robotMessage", text=text)
+        self.state = "stby"
+
+    def checkBoard(self, img):
+        # Compare the classified squares with the game state, returns the squares that disagree
+        occupied, white = self.boardClassifier.classify(img)
+        wrong = (occupied ^ self.board.occupied) | (white ^ self.board.occupied_co[cl.chess.WHITE])
+        squares = [cl.chess.SQUARE_NAMES[square] for square in cl.chess.SquareSet(wrong)]
+        if squares:
+            print(f"Debug: Board differs from the game on {squares}")
+            self.emit("robotMessage", text="Check " + " ".join(squares[:3]))
+        return squares
+
+    # Clock and end of the game
+    def _tick(self):
+        if not self.playing or not self.gameClock:
+            return
+        self.emit("clock", white=self.gameClock.left(cl.chess.WHITE), black=self.gameClock.left(cl.chess.BLACK))
+        if self.gameClock.running is not None and self.gameClock.flagged(self.gameClock.running):
+            self._gameOver()
+
+    def _quit(self):
+        if self.playing:
+            self._gameOver()
+
+    def _gameOver(self):
+        with self._motionLock:
+            self.playing = False
+            self.motionExecutor.cancel()
+            # Back to rest from wherever the arm stopped, a piece it holds stays in the gripper
+            self.motionExecutor.submit(self.motionExecutor.move_to_pose(ac.angles_rest[:4] + [None]))
+        self.state = "stby"
+        self._detectStop.set()
+        self.ponderer.stop()
+        ac.save_trajectory_cache(background=True)
+
+        gameResult = self.board.result()
+        if self.gameClock:
+            if self.gameClock.running is not None and self.gameClock.flagged(self.gameClock.running):
+                gameResult = "0-1" if self.gameClock.running == cl.chess.WHITE else "1-0"
+            self.gameClock.stop()
+            thinking, moving = self.gameClock.summary(not self.playerColor)
+            print(f"Debug: Robot time {thinking:.1f} s thinking, {moving:.1f} s arm motion")
+
+        robotWins = gameResult == ("0-1" if self.playerColor else "1-0")
+        if gameResult == "1-0":
+            self.emit("gameMessage", text="Game Over\nWhite Wins")
+        elif gameResult == "0-1":
+            self.emit("gameMessage", text="Game Over\nBlack Wins")
+        elif gameResult == "1/2-1/2":
+            self.emit("gameMessage", text="Game Over\nDraw")
+        else:
+            self.emit("gameMessage", text="Game Over")
+        if gameResult in ("1-0", "0-1") and not robotWins:
+            self.audio.play("goodbye")
+        self.emit("robotMessage", text="Goodbye")
+        self.emit("gameOver", result=gameResult, robotWins=robotWins)
+
+# Headless daemon
+def printEvent(event, data):
+    if event in ("gameMessage", "robotMessage", "error"):
+        print(f"[{event}] {data['text']}")
+    elif event == "board":
+        print(data["board"])
+    elif event == "gameOver":
+        print(f"[gameOver] {data['result']}")
+
+def openCamera(selectedCam, files=None):
+    # Same numbering as the GUI: 0 is the RPi camera, n the USB camera n - 1
+    if files:
+        return cs.CaptureService(cs.FileCamera(files)).start()
+    if selectedCam:
+        cap = cv2.VideoCapture(selectedCam - 1)
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        if not cap.isOpened():
+            raise RuntimeError('USB Video device not found')
+        return cs.CaptureService(cs.OpenCVSource(cap)).start()
+    from picamera import PiCamera
+    cap = PiCamera()
+    cap.resolution = (640, 480)
+    return cs.CaptureService(cs.PiCameraSource(cap)).start()
+
+def headlessSetup(camera, side, stableFrames=10):
+    """
+    Calibration without a display: the homography is taken from the empty board as soon
+    as the pattern is found, then the game starts once the start position has been set
+    up and stayed still for stableFrames frames.
+    """
+    cbPattern = vm.loadPattern()
+    print("Waiting for the empty board...")
+    while True:
+        ret, frame = camera.read()
+        if ret:
+            found, homography = vm.findTransformation(frame, cbPattern)
+            if found:
+                break
+    emptyIMG = frame.copy()
+    rotMat = vm.findRotation(SIDE_ANGLES[side])
+    warp = vm.BoardWarp(homography, rotMat)
+    classifier = vm.BoardClassifier(warp.apply(emptyIMG))
+
+    print("Camera calibrated, waiting for the pieces...")
+    start = cl.chess.Board()
+    stable = 0
+    while stable < stableFrames:
+        ret, frame = camera.read()
+        if not ret:
+            continue
+        occupied, _ = classifier.classify(warp.apply(frame))
+        stable = stable + 1 if occupied == start.occupied else 0
+    return homography, rotMat, emptyIMG, warp.apply(frame)
+
+def loadParams(path='params.txt'):
+    with open(path) as json_file:
+        return json.load(json_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play without a display")
+    parser.add_argument("--engine", default="/usr/games/stockfish", help="UCI engine executable")
+    parser.add_argument("--camera", type=int, default=0, help="0 RPi camera, n USB camera n - 1")
+    parser.add_argument("--files", help="Directory of images replayed as the camera (tests)")
+    parser.add_argument("--side", choices=list(SIDE_ANGLES), default="1-2", help="Image quadrants of the white side")
+    parser.add_argument("--black", action="store_true", help="The human plays black")
+    parser.add_argument("--skill", type=int, default=20, help="Engine Skill Level")
+    parser.add_argument("--time", choices=list(TIME_CONTROLS), default="Untimed", help="Time control")
+    parser.add_argument("--games", type=int, default=0, help="Games to play, 0 runs forever")
+    args = parser.parse_args()
+
+    engineService = es.EngineService(args.engine).start()
+    audio = au.AudioService().start()
+    moveBook = mb.MoveBook()
+    controller = GameController(engineService, moveBook, audio, me.MotionExecutor(), loadParams())
+    controller.autoPromotion = "q"
+    controller.subscribe(printEvent)
+    gameOver = threading.Event()
+    controller.subscribe(lambda event, data: gameOver.set() if event == "gameOver" else None)
+    controller.start()
+    camera = openCamera(args.camera, args.files)
+
+    played = 0
+    try:
+        while not args.games or played < args.games:
+            homography, rotMat, emptyIMG, startIMG = headlessSetup(camera, args.side)
+            gameOver.clear()
+            controller.post("newGame", camera=camera, homography=homography, rotMat=rotMat, emptyIMG=emptyIMG,
+                            startIMG=startIMG, playerColor=not args.black, skillLevel=args.skill, timeControl=args.time)
+            gameOver.wait()
+            played += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.stop()
+        camera.stop()
+        engineService.quit()
+        moveBook.close()
+        audio.stop()
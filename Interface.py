@@ -1,21 +1,24 @@
 import FreeSimpleGUI as sg
+import tkinter as tk
 import ChessLogic as cl
-import time
 import os
-import threading
 import cv2
 import sys
 import json
 import VisionModule as vm
 import platform
 import ArmControl as ac
+import MotionExecutor as me
+import CaptureService as cs
+import EngineService as es
+import MoveBook as mb
+import GameClock as gc
+import AudioService as au
+import GameController as gmc
 import lss_const as lssc
-import pygame
-import pathlib
 import numpy as np
 
 try:
-    from picamera.array import PiRGBArray
     from picamera import PiCamera
 except:
     pass
@@ -53,9 +56,11 @@ kingW = os.path.join(CHESS_PATH, 'nkingw.png')
 
 images = {BISHOPB: bishopB, BISHOPW: bishopW, PAWNB: pawnB, PAWNW: pawnW, KNIGHTB: knightB, KNIGHTW: knightW,
           ROOKB: rookB, ROOKW: rookW, KINGB: kingB, KINGW: kingW, QUEENB: queenB, QUEENW: queenW, BLANK: blank}
+pieceImages = {}  # Piece number -> tk.PhotoImage, each PNG is decoded once
+shownBoard = {(i, j): BLANK for i in range(8) for j in range(8)}  # Piece number displayed on each square button
+shownColor = None  # Orientation of the displayed coordinates
 
 FENCODE = ""
-colorTurn = True
 graveyard = 'k0'
 playerColor = True
 playing = False
@@ -71,8 +76,15 @@ chessRoute = ""
 detected = True
 selectedCam = 0
 skillLevel = 10
+engineService = None  # Started once at launch, shared by every game
+moveBook = None  # Opening book and engine result cache, checked before the engine
+timeControl = "Untimed"
+controller = None  # Game state machine, runs on its own thread and reports through window events
 cap = cv2.VideoCapture()
+camera = None  # CaptureService reading cap in the background
+motionExecutor = me.MotionExecutor()
 rotMat = np.zeros((2, 2))
+emptyIMG = None  # Camera frame of the empty board taken at calibration
 physicalParams = {
     "baseradius": 0.00,
     "cbFrame": 0.00,
@@ -89,69 +101,6 @@ def systemConfig():
     elif platform.system() == 'Linux':
         chessRoute = "/usr/games/stockfish"
 
-def pcTurn(board, engine):
-    global sequence, state, homography, cap, selectedCam
-    command = ""
-    pcMove = engine.play(board, cl.chess.engine.Limit(time=1))
-    sequence = cl.sequenceGenerator(pcMove.move.uci(), board)
-    
-    window["gameMessage"].update(sequence["type"])
-    if sequence["type"] in ("White Queen Side Castling", "Black Queen Side Castling"):
-        command = "q_castling"
-    elif sequence["type"] in ("White King Side Castling", "Black King Side Castling"):
-        command = "k_castling"
-    elif sequence["type"] == "Capture":
-        command = "capture"
-    elif sequence["type"] == "Passant":
-        command = "passant"
-    elif sequence["type"] == "Promotion":
-        command = "promotion"
-    if command:
-        speakThread = threading.Thread(target=speak, args=[command], daemon=True)
-        speakThread.start()
-        
-    command = ""
-    ac.executeMove(sequence["seq"], physicalParams, playerColor, homography, cap, selectedCam)
-    board.push(pcMove.move)
-    updateBoard(sequence, board)
-    if board.is_checkmate():
-        window["robotMessage"].update("CHECKMATE!")
-        command = "checkmate"
-    elif board.is_check():
-        window["robotMessage"].update("CHECK!")
-        command = "check"
-    if command:
-        speakThread = threading.Thread(target=speak, args=[command], daemon=True)
-        speakThread.start()
-    state = "robotMove"
-    if board.is_game_over():
-        playing = False
-        state = "showGameResult"
-
-def startEngine():
-    global engine, state
-    engine = cl.chess.engine.SimpleEngine.popen_uci(chessRoute)
-    engine.configure({"Skill Level": skillLevel})
-    if playerColor == colorTurn:
-        state = "playerTurn"
-    else:
-        state = "pcTurn"
-
-def playerTurn(board, squares):
-    result = cl.moveAnalysis(squares, board)
-    piece = ""
-    if result:
-        if result["type"] == "Promotion":
-            while not piece:
-                piece = coronationWindow()
-            result["move"] += piece
-        sequence = cl.sequenceGenerator(result["move"], board)
-        window["gameMessage"].update(sequence["type"])
-        board.push_uci(result["move"])
-        updateBoard(sequence, board)
-        return True
-    return False
-
 def startGame():
     window["newGame"].update(disabled=True)
     window["quit"].update(disabled=False)
@@ -161,7 +110,33 @@ def startGame():
 def quitGame():
     window["newGame"].update(disabled=False)
     window["quit"].update(disabled=True)
-    engine.quit()
+
+def gameEvent(event, data):
+    # Controller listener, runs on the controller threads: hand the event over to the GUI thread
+    window.write_event_value(("game", event), data)
+
+def showGameEvent(event, data):
+    global playing
+    if event in ("gameMessage", "robotMessage"):
+        window[event].update(data["text"])
+    elif event == "gameStarted":
+        startGame()
+        redrawBoard(data["board"])
+    elif event == "board":
+        updateBoard(data["sequence"], data["board"])
+    elif event == "clock":
+        window["whiteClock"].update(gc.formatTime(data["white"]))
+        window["blackClock"].update(gc.formatTime(data["black"]))
+    elif event == "promotion":
+        controller.post("promotion", piece=coronationWindow())
+    elif event == "error":
+        sg.popup_error(f"Error processing move: {data['text']}")
+    elif event == "gameOver":
+        playing = False
+        closeCam()
+        if data["robotWins"]:
+            ac.winLED(ac.allMotors)
+        quitGame()
 
 # Interface Functions
 def renderSquare(image, key, location):
@@ -173,80 +148,53 @@ def renderSquare(image, key, location):
                      border_width=0, button_color=('white', color),
                      pad=(0, 0), key=key)
 
-def redrawBoard(board):
-    columns = 'abcdefgh'
-    global playerColor
+def pieceImage(pieceNum):
+    if pieceNum not in pieceImages:
+        pieceImages[pieceNum] = tk.PhotoImage(file=images[pieceNum])
+    return pieceImages[pieceNum]
+
+def squareKey(square):
+    # Button key of a python-chess square for the current orientation
+    x = 7 - cl.chess.square_rank(square)
+    y = cl.chess.square_file(square)
     if playerColor:
-        sq = 63
-        for i in range(8):
-            window[str(8-i)+"r"].update("   "+str(8-i))
-            window[str(8-i)+"l"].update(str(8-i)+"   ")
-            for j in range(8):
-                window[columns[j]+"t"].update(columns[j])
-                window[columns[j]+"b"].update(columns[j])    
-                color = blackSquareColor if (i + 7-j) % 2 else whiteSquareColor
-                pieceNum = board.piece_type_at(sq)
-                if pieceNum:
-                    if not board.color_at(sq):
-                        pieceNum += 6
-                else:
-                    pieceNum = 0
-                piece_image = images[pieceNum]
-                elem = window[(i, 7-j)]
-                elem.update(button_color=('white', color),
-                            image_filename=piece_image)
-                sq -= 1
+        return (x, y)
+    return (7-x, 7-y)
+
+def setSquare(board, square):
+    # Only touch the Tk widget when the piece shown on the square changes
+    pieceNum = board.piece_type_at(square)
+    if pieceNum:
+        if not board.color_at(square):
+            pieceNum += 6
     else:
-        sq = 0
+        pieceNum = BLANK
+    key = squareKey(square)
+    if shownBoard[key] != pieceNum:
+        window[key].Widget.configure(image=pieceImage(pieceNum))
+        shownBoard[key] = pieceNum
+
+def redrawBoard(board):
+    columns = 'abcdefgh'
+    global playerColor, shownColor
+    if shownColor != playerColor:
         for i in range(8):
-            window[str(8-i)+"r"].update("   "+str(i+1))
-            window[str(8-i)+"l"].update(str(i+1)+"   ")
-            for j in range(8):
-                window[columns[j]+"t"].update(columns[7-j])
-                window[columns[j]+"b"].update(columns[7-j]) 
-                color = blackSquareColor if (i + 7-j) % 2 else whiteSquareColor
-                pieceNum = board.piece_type_at(sq)
-                if pieceNum:
-                    if not board.color_at(sq):
-                        pieceNum += 6
-                else:
-                    pieceNum = 0
-                piece_image = images[pieceNum]
-                elem = window[(i, 7-j)]
-                elem.update(button_color=('white', color),
-                            image_filename=piece_image)
-                sq += 1
+            number = str(8-i) if playerColor else str(i+1)
+            window[str(8-i)+"r"].update("   "+number)
+            window[str(8-i)+"l"].update(number+"   ")
+            column = columns[i] if playerColor else columns[7-i]
+            window[columns[i]+"t"].update(column)
+            window[columns[i]+"b"].update(column)
+        shownColor = playerColor
+    for square in range(64):
+        setSquare(board, square)
 
 def updateBoard(move, board):
-    global playerColor, images
-    for cont in range(0, len(move["seq"]), 4):
-        squareCleared = move["seq"][cont:cont+2]
-        squareOcupied = move["seq"][cont+2:cont+4]
-        scNum = cl.chess.SQUARE_NAMES.index(squareCleared)
-        y = cl.chess.square_file(scNum)
-        x = 7 - cl.chess.square_rank(scNum)
-        color = blackSquareColor if (x + y) % 2 else whiteSquareColor
-        if playerColor:
-            elem = window[(x, y)]
-        else:
-            elem = window[(7-x, 7-y)]
-        elem.update(button_color=('white', color),
-                    image_filename=blank)  
-
-        if squareOcupied != graveyard:
-            soNum = cl.chess.SQUARE_NAMES.index(squareOcupied)
-            pieceNum = board.piece_type_at(soNum)
-            if not board.color_at(soNum):
-                pieceNum += 6
-            y = cl.chess.square_file(soNum)
-            x = 7 - cl.chess.square_rank(soNum)
-            color = blackSquareColor if (x + y) % 2 else whiteSquareColor
-            if playerColor:
-                elem = window[(x, y)]
-            else:
-                elem = window[(7-x, 7-y)]    
-            elem.update(button_color=('white', color),
-                        image_filename=images[pieceNum])         
+    # Only the squares of the robot sequence can change
+    for cont in range(0, len(move["seq"]), 2):
+        square = move["seq"][cont:cont+2]
+        if square != graveyard:
+            setSquare(board, cl.chess.SQUARE_NAMES.index(square))
 
 def sideConfig():
     global newGameState, state, whiteSide, prevIMG, rotMat
@@ -297,12 +245,13 @@ def ocupiedBoard():
                 [sg.Text('_'*30)],
                 [sg.Button("Back"), sg.Submit("Next")]]
     newGameWindow = sg.Window(windowName, default_button_element_size=(12,1), auto_size_buttons=False, location=(100,50), icon='interface_images/robot_icon.ico').layout(initGame)  
+    warp = vm.BoardWarp(homography)
 
     while True:
         button, value = newGameWindow.read(timeout=10)
         if detected:    
             frame = takePIC()
-            prevIMG = vm.applyHomography(frame, homography)
+            prevIMG = warp.apply(frame, prevIMG)
             imgbytes = cv2.imencode('.png', prevIMG)[1].tobytes()
             newGameWindow['boardVideo'].update(data=imgbytes)
         if button == "Next":
@@ -318,8 +267,8 @@ def ocupiedBoard():
     newGameWindow.close()
 
 def calibration():
-    global newGameState, state, selectedCam, homography, detected
-    cbPattern = cv2.imread(route+'interface_images/cb_pattern.jpg', cv2.IMREAD_GRAYSCALE)
+    global newGameState, state, selectedCam, homography, detected, emptyIMG
+    cbPattern = vm.loadPattern()
     windowName = "Camera calibration"
     initGame = [[sg.Text('Please adjust your camera and remove any chess piece', justification='center', pad=(25,(5,15)), font='Any 15', key="calibrationBoard")],
                 [sg.Image(filename='', key='boardVideo')],
@@ -342,11 +291,11 @@ def calibration():
                 print("Debug: Calibration failed, homography not computed")
                 newGameWindow['calibrationBoard'].update("Please adjust your camera and remove any chess piece")
         if button == "Next" and retIMG:
+            emptyIMG = frame.copy()
             newGameState = "ocupiedBoard"
             break
         if button == "Back":
-            if not selectedCam:
-                cap.close()
+            closeCam()
             newGameState = "config"
             break
         if button in (None, 'Exit'):
@@ -356,12 +305,13 @@ def calibration():
     newGameWindow.close() 
 
 def newGameWindow():
-    global playerColor, newGameState, state, detected, cap, selectedCam, skillLevel
+    global playerColor, newGameState, state, detected, cap, selectedCam, skillLevel, timeControl
     windowName = "Configuration"
     frame_layout = [[sg.Radio('RPi Cam', group_id='grp', default=True, key="rpicam"), sg.VerticalSeparator(pad=None), sg.Radio('USB0', group_id='grp', key="usb0"), sg.Radio('USB1', group_id='grp', key="usb1")]]
     initGame = [[sg.Text('Game Parameters', justification='center', pad=(25,(5,15)), font='Any 15')],
                 [sg.Checkbox('Play as White', key='userWhite', default=playerColor)],
                 [sg.Combo([sz for sz in range(1, 11)], default_value=10, key="enginelevel"), sg.Text('Engine skill level', pad=(0,0))],
+                [sg.Combo(list(gmc.TIME_CONTROLS), default_value=timeControl, key="timecontrol", readonly=True), sg.Text('Time control', pad=(0,0))],
                 [sg.Frame('Camera Selection', frame_layout, pad=(0, 10), title_color='white')],
                 [sg.Text('_'*30)],
                 [sg.Button("Exit"), sg.Submit("Next")]]
@@ -380,6 +330,7 @@ def newGameWindow():
                 newGameState = "calibration"
                 playerColor = value["userWhite"]
                 skillLevel = value["enginelevel"] * 2
+                timeControl = value["timecontrol"]
             break
         if button in (None, 'Exit'):
             state = "stby"
@@ -425,30 +376,34 @@ def coronationWindow():
     return pieceSelected
 
 def takePIC():  
-    global selectedCam, cap
-    if selectedCam:
-        for i in range(5):
-            cap.grab()
-        _, frame = cap.read()
-    else:
-        cap.capture(rawCapture, format="bgr")
-        frame = rawCapture.array
-        rawCapture.truncate(0)
+    # First frame taken after the call
+    _, frame = camera.read()
     return frame
 
+def closeCam():
+    # Stop the capture thread and release the device, does nothing if it is already closed
+    global camera
+    if camera is None:
+        return
+    camera.stop()
+    camera = None
+    if isinstance(cap, cv2.VideoCapture):
+        cap.release()
+    else:
+        cap.close()
+
 def quitGameWindow():
     global playing, window, cap
     windowName = "Quit Game"
     quitGame = [[sg.Text('Are you sure?', justification='center', size=(30, 1), font='Any 13')],
                 [sg.Submit("Yes", size=(15, 1)), sg.Submit("No", size=(15, 1))]]
-    if not selectedCam:
-        cap.close()
     if playing:
         while True:
             windowNewGame = sg.Window(windowName, default_button_element_size=(12,1), auto_size_buttons=False, icon='interface_images/robot_icon.ico').layout(quitGame)
             button, value = windowNewGame.read()
             if button == "Yes":
                 playing = False
+                closeCam()  # Only once confirmed, "No" keeps playing with the camera
                 break
             if button in (None, 'Exit', "No"):
                 break   
@@ -469,17 +424,21 @@ def mainBoardLayout():
     board_layout.append([sg.Text(' '*12)] + [sg.Text('{}'.format(a), pad=((0,47),0), font='Any 13', key=a+'b') for a in 'abcdefgh'])
 
     frame_layout_game = [[sg.Button('---', size=(14, 2), border_width=0, font=('courier', 16), button_color=('black', "white"), pad=(4, 4), key="gameMessage")]]
+    frame_layout_clock = [[sg.Image(filename='interface_images/wclock.png', subsample=3), sg.Text('--:--', size=(7, 1), font=('courier', 16), key="whiteClock")],
+                          [sg.Image(filename='interface_images/bclock.png', subsample=3), sg.Text('--:--', size=(7, 1), font=('courier', 16), key="blackClock")]]
     frame_layout_robot = [[sg.Button('---', size=(14, 2), border_width=0, font=('courier', 16), button_color=('black', "white"), pad=(4, 4), key="robotMessage")]]
     board_controls = [[sg.Button('New Game', key='newGame', size=(15, 2), pad=(0,(0,7)), font=('courier', 16))],
                      [sg.Button('Quit', key='quit', size=(15, 2), pad=(0, 0), font=('courier', 16), disabled=True)],
                      [sg.Frame('GAME', frame_layout_game, pad=(0, 10), font='Any 12', title_color='white', key="frameMessageGame")],
-                     [sg.Frame('ROBOT', frame_layout_robot, pad=(0, (0,10)), font='Any 12', title_color='white', key="frameMessageRobot")]]
+                     [sg.Frame('ROBOT', frame_layout_robot, pad=(0, (0,10)), font='Any 12', title_color='white', key="frameMessageRobot")],
+                     [sg.Frame('CLOCK', frame_layout_clock, pad=(0, (0,10)), font='Any 12', title_color='white', key="frameClock")]]
     layout = [[sg.Menu(menu_def, tearoff=False, key="manubar")], 
               [sg.Column(board_layout), sg.VerticalSeparator(pad=None), sg.Column(board_controls)]]
     return layout
 
 def initCam(selectedCam):
-    global detected, rawCapture
+    global detected, camera
+    closeCam()  # Camera of a previous game still open
     if selectedCam:
         cap = cv2.VideoCapture(selectedCam - 1)
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
@@ -487,6 +446,8 @@ def initCam(selectedCam):
         if not cap.isOpened():
             detected = False  
             sg.popup_error('USB Video device not found')
+        else:
+            camera = cs.CaptureService(cs.OpenCVSource(cap)).start()
     else:
         cap = PiCamera()
         if not cap:
@@ -494,7 +455,7 @@ def initCam(selectedCam):
             sg.popup_error('RPi camera module not found')
         else:
             cap.resolution = (640, 480)
-            rawCapture = PiRGBArray(cap, size=(640, 480))
+            camera = cs.CaptureService(cs.PiCameraSource(cap)).start()
     return cap
 
 def loadParams():
@@ -538,34 +499,43 @@ def phisicalConfig():
 layout = mainBoardLayout()
 window = sg.Window('ChessRobot', default_button_element_size=(12,1), auto_size_buttons=False, icon='interface_images/robot_icon.ico').layout(layout)
 
-def speak(command):
-    pygame.mixer.init()
-    filePath = str(pathlib.Path().absolute()) + "/audio/"
-    pygame.mixer.music.load(filePath + command + ".mp3")
-    pygame.mixer.music.play()
+audio = au.AudioService()
 
 def main():
-    global playerColor, state, playing, sequence, newGameState, detected, physicalParams, prevIMG, rotMat, homography, colorTurn
+    global state, playing, newGameState, engineService, moveBook, controller
     systemConfig()
+    engineService = es.EngineService(chessRoute).start()
+    audio.start()
+    moveBook = mb.MoveBook()
     loadParams()
-    board = cl.chess.Board()
-    squares = []
-    last_move_time = time.time()
+    controller = gmc.GameController(engineService, moveBook, audio, motionExecutor, physicalParams)
+    controller.subscribe(gameEvent)
+    controller.start()
 
     while True:
-        button, value = window.read(timeout=100)
+        # Blocks until a GUI or controller event arrives
+        button, value = window.read()
         if button in (None, 'Exit') or (value and value.get("manubar") == "Exit"):
             angles_rest = (0, -1150, 450, 1100, 0)
             _ = ac.LSSA_moveMotors(angles_rest)
             ac.allMotors.limp()
             ac.allMotors.setColorLED(lssc.LSS_LED_Black)
+            controller.stop()
+            engineService.quit()
+            moveBook.close()
+            audio.stop()
             break
 
+        if isinstance(button, tuple) and button[0] == "game":
+            showGameEvent(button[1], value[button])
+            continue
+
         if value and value.get("manubar") == "Dimensions":
             if playing:
                 sg.popup("Please, first quit the game")
             else:
                 phisicalConfig()
+                controller.params = physicalParams
 
         if button == "newGame":
             if all(physicalParams.values()): 
@@ -577,12 +547,9 @@ def main():
             ac.allMotors.setColorLED(lssc.LSS_LED_Black)
             quitGameWindow()
             if not playing:
-                state = "showGameResult"
-
-        if state == "stby":
-            pass
+                controller.post("quit")
 
-        elif state == "startMenu":
+        while state == "startMenu":
             if newGameState == "config":
                 newGameWindow()
             elif newGameState == "calibration":
@@ -594,85 +561,10 @@ def main():
             elif newGameState == "initGame":
                 playing = True
                 newGameState = "config"
-                board = cl.chess.Board()
-                if FENCODE:
-                    board = cl.chess.Board(FENCODE)
-                colorTurn = board.turn
-                startGame()
-                last_move_time = time.time()
-                startEngineThread = threading.Thread(target=startEngine, daemon=True)
-                startEngineThread.start()
-                speak("good_luck")
                 state = "stby"
-                redrawBoard(board)
-
-        elif state == "playerTurn":
-            if time.time() - last_move_time >= 30:  # 30-second auto-timer
-                try:
-                    print("Debug: 30-second timer triggered, capturing image...")
-                    currentIMG = takePIC()
-                    cv2.imwrite("debug_prevIMG.png", prevIMG)
-                    print("Debug: Image captured, applying homography...")
-                    curIMG = vm.applyHomography(currentIMG, homography)
-                    print("Debug: Homography applied, applying rotation...")
-                    curIMG = vm.applyRotation(curIMG, rotMat)
-                    cv2.imwrite("debug_curIMG.png", curIMG)
-                    print("Debug: Rotation applied, detecting moves...")
-                    squares = vm.findMoves(prevIMG, curIMG)
-                    print(f"Debug: Move detection complete, squares changed: {squares}")
-                    if playerTurn(board, squares):
-                        print("Debug: Valid move detected, transitioning to pcTurn")
-                        state = "pcTurn"
-                        last_move_time = time.time()
-                        if board.is_game_over():
-                            print("Debug: Game over, transitioning to showGameResult")
-                            playing = False
-                            state = "showGameResult"
-                    else:
-                        print("Debug: Invalid move detected, staying in playerTurn")
-                        window["gameMessage"].update("Invalid move!")
-                        speak("invalid_move")
-                        state = "playerTurn"
-                        last_move_time = time.time()
-                except Exception as e:
-                    print(f"Error in playerTurn: {e}")
-                    sg.popup_error(f"Error processing move: {e}")
-                    state = "stby"
-
-        elif state == "pcTurn":
-            pcTurnThread = threading.Thread(target=pcTurn, args=(board, engine,), daemon=True)
-            pcTurnThread.start()
-            state = "stby"
-
-        elif state == "robotMove":
-            previousIMG = takePIC()
-            prevIMG = vm.applyHomography(previousIMG, homography)
-            prevIMG = vm.applyRotation(prevIMG, rotMat)
-            state = "playerTurn"
-            last_move_time = time.time()
-            window["robotMessage"].update("---")
-
-        elif state == "showGameResult":
-            gameResult = board.result()
-            if gameResult == "1-0":
-                window["gameMessage"].update("Game Over\nWhite Wins")
-                if not playerColor:
-                    ac.winLED(ac.allMotors)
-                else:
-                    speak("goodbye")
-            elif gameResult == "0-1":
-                window["gameMessage"].update("Game Over\nBlack Wins")
-                if playerColor:
-                    ac.winLED(ac.allMotors)
-                else:
-                    speak("goodbye")
-            elif gameResult == "1/2-1/2":
-                window["gameMessage"].update("Game Over\nDraw")
-            else:
-                window["gameMessage"].update("Game Over")
-            window["robotMessage"].update("Goodbye")
-            quitGame()
-            state = "stby"
+                controller.post("newGame", camera=camera, homography=homography, rotMat=rotMat, emptyIMG=emptyIMG,
+                                startIMG=prevIMG, playerColor=playerColor, skillLevel=skillLevel,
+                                timeControl=timeControl, fen=FENCODE)
 
     window.close()
 
@@ -0,0 +1,272 @@
+import numpy as np
+from functools import lru_cache
+
+# Arm geometry in the same units as params.txt (inches), fitted to the measured
+# ArmControl.square_angles with fitArm (python Kinematics.py). Any of these keys can be
+# overridden by adding it to params.txt.
+ARM_GEOMETRY = {
+    "shoulderHeight": 2.0,  # Shoulder axis above the board surface
+    "upperArm": 4.85,       # Shoulder to elbow
+    "forearm": 4.37,        # Elbow to wrist
+    "gripper": 4.58,        # Wrist to the grasp point between the fingers
+    "baseOffset": -9.25     # Correction of baseradius + cbFrame, the board is this much closer to the base axis
+}
+
+# Joint angle (degrees) to servo angle: servo = offset + sign * joint, fitted with ARM_GEOMETRY
+SERVO_MAP = [
+    (93.33, -1),   # Servo 0 (Base): yaw, 0 = straight towards the board, the a-file side (y > 0 for white) is below 90
+    (226.34, -1),  # Servo 1 (Shoulder): elevation of the upper arm from horizontal
+    (108.38, 1),   # Servo 2 (Elbow): bend relative to the upper arm, 0 = straight, negative = down
+    (73.53, -1)    # Servo 3 (Wrist): pitch relative to the forearm
+]
+
+# Gripper pitch tried for every target, from pointing straight down towards horizontal
+APPROACH_PITCHES = np.radians(np.arange(-90, 1, 5))
+
+GRAVEYARD = 64  # Index of the graveyard "k0" after the 64 squares
+HOVER = 0  # Level index of the hover height in angleTable
+GRASP = 1  # Level index of the grasp height in angleTable
+HOVER_PIECES = 2.0  # Hover height above the board, in piece heights (clears a carried piece)
+SQUARE_NAMES = [f + r for r in "12345678" for f in "abcdefgh"] + ["k0"]  # Ordered by squareIndex
+
+def squareIndex(square):
+    '''
+    INPUT:
+        square -> Chess coordinate ("e2") or the graveyard "k0".
+    OUTPUT:
+        index -> 0-63 in python-chess order (a1 = 0, h8 = 63), 64 for the graveyard.
+    '''
+    if square[0].lower() == 'k':
+        return GRAVEYARD
+    return (ord(square[0].lower()) - 97) + 8 * (int(square[1]) - 1)
+
+def squaresXY(params, color):
+    '''
+    Vectorized ArmControl.CBtoXY for the 64 squares and the graveyard.
+
+    OUTPUT:
+        xy -> Array (65, 2) with the (x, y) coordinates in params units, indexed by squareIndex.
+    '''
+    files = np.arange(64) % 8
+    ranks = np.arange(64) // 8
+    sqSize = params["sqSize"]
+    if color:  # White -> Robot plays black
+        sqletter = 4 - files - (files > 3)
+        sqNumber = 8 - ranks
+    else:
+        sqletter = files - 4 + (files > 3)
+        sqNumber = ranks + 1
+
+    xy = np.empty((65, 2))
+    baseOffset = params.get("baseOffset", ARM_GEOMETRY["baseOffset"])
+    xy[:64, 0] = params["baseradius"] + params["cbFrame"] + baseOffset + sqSize * sqNumber - sqSize * 0.5
+    xy[:64, 1] = sqSize * sqletter - np.copysign(sqSize * 0.5, sqletter)
+    xy[GRAVEYARD] = 6 * sqSize
+    return xy
+
+def solveIK(points, params):
+    '''
+    Batched inverse kinematics of the 4-DOF arm.
+
+    For every target all APPROACH_PITCHES are solved at once (elbow up) and the first
+    one, closest to a vertical grasp, that keeps every servo in 0-180 degrees is kept.
+
+    INPUT:
+        points -> Array (N, 3) of grasp point coordinates (x, y, z), z above the board.
+        params -> Physical parameters, may override ARM_GEOMETRY keys.
+    OUTPUT:
+        angles -> Array (N, 4) of servo angles for servos 0-3, NaN rows are unreachable.
+    '''
+    geometry = {key: params.get(key, value) for key, value in ARM_GEOMETRY.items()}
+    L1, L2, L3 = geometry["upperArm"], geometry["forearm"], geometry["gripper"]
+    points = np.asarray(points, dtype=float)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+
+    yaw = np.arctan2(y, x)
+    r = np.hypot(x, y)[:, None]
+    phi = APPROACH_PITCHES[None, :]
+    wr = r - L3 * np.cos(phi)  # Wrist position in the arm plane, relative to the shoulder
+    wz = z[:, None] - L3 * np.sin(phi) - geometry["shoulderHeight"]
+
+    cosElbow = (wr ** 2 + wz ** 2 - L1 ** 2 - L2 ** 2) / (2 * L1 * L2)
+    reachable = np.abs(cosElbow) <= 1
+    elbow = -np.arccos(np.clip(cosElbow, -1, 1))
+    shoulder = np.arctan2(wz, wr) - np.arctan2(L2 * np.sin(elbow), L1 + L2 * np.cos(elbow))
+    wrist = phi - shoulder - elbow
+
+    joints = np.degrees(np.stack([np.broadcast_to(yaw[:, None], shoulder.shape), shoulder, elbow, wrist], axis=-1))
+    offsets = np.array([m[0] for m in SERVO_MAP], dtype=float)
+    signs = np.array([m[1] for m in SERVO_MAP], dtype=float)
+    servos = offsets + signs * joints
+    valid = reachable & np.all((servos >= 0) & (servos <= 180), axis=-1)
+
+    best = np.argmax(valid, axis=1)
+    angles = servos[np.arange(len(points)), best]
+    angles[~valid.any(axis=1)] = np.nan
+    return angles
+
+def angleTable(params, color, goDown):
+    '''
+    Servo angles for every square and the graveyard at hover and grasp heights.
+
+    The table is computed in one batched solveIK call and cached per calibration.
+
+    INPUT:
+        params -> Physical parameters (baseradius, cbFrame, sqSize, cbHeight, pieceHeight).
+        color -> True if the human plays white.
+        goDown -> How far below the top of the tallest piece the gripper closes.
+    OUTPUT:
+        table -> Read-only array (65, 2, 4) indexed by [squareIndex, HOVER/GRASP, servo].
+    '''
+    return _angleTable(tuple(sorted(params.items())), bool(color), float(goDown))
+
+@lru_cache(maxsize=8)
+def _angleTable(paramItems, color, goDown):
+    params = dict(paramItems)
+    points = squarePoints(params, color, goDown)
+    table = solveIK(points.reshape(-1, 3), params).reshape(65, 2, 4)
+    table.setflags(write=False)
+    return table
+
+def squarePoints(params, color, goDown):
+    '''
+    OUTPUT:
+        points -> Array (65, 2, 3) of the (x, y, z) targets indexed by [squareIndex, HOVER/GRASP].
+    '''
+    xy = squaresXY(params, color)
+    top = params["cbHeight"] + params["pieceHeight"]
+    heights = np.array([params["cbHeight"] + HOVER_PIECES * params["pieceHeight"], top - goDown])
+
+    points = np.empty((65, 2, 3))
+    points[:, :, :2] = xy[:, None, :]
+    points[:, :, 2] = heights[None, :]
+    return points
+
+def forwardKinematics(angles, params, geometry=None, servoMap=None):
+    '''
+    Grasp point of the arm for servo angles, the inverse of solveIK.
+
+    INPUT:
+        angles -> Array (N, 4) of servo angles for servos 0-3.
+        params -> Physical parameters, may override ARM_GEOMETRY keys.
+        geometry, servoMap -> Model to use instead of ARM_GEOMETRY and SERVO_MAP.
+    OUTPUT:
+        points -> Array (N, 3) of (x, y, z) coordinates, as in squaresXY.
+    '''
+    if geometry is None:
+        geometry = {key: params.get(key, value) for key, value in ARM_GEOMETRY.items()}
+    servoMap = SERVO_MAP if servoMap is None else servoMap
+    offsets = np.array([m[0] for m in servoMap], dtype=float)
+    signs = np.array([m[1] for m in servoMap], dtype=float)
+    yaw, shoulder, elbow, wrist = np.radians((np.asarray(angles, dtype=float) - offsets) / signs).T
+
+    L1, L2, L3 = geometry["upperArm"], geometry["forearm"], geometry["gripper"]
+    r = L1 * np.cos(shoulder) + L2 * np.cos(shoulder + elbow) + L3 * np.cos(shoulder + elbow + wrist)
+    z = geometry["shoulderHeight"] + L1 * np.sin(shoulder) + L2 * np.sin(shoulder + elbow) + L3 * np.sin(shoulder + elbow + wrist)
+    return np.stack([r * np.cos(yaw), r * np.sin(yaw), z], axis=-1)
+
+def modelError(measured, params, color, goDown, servoMap=None):
+    '''
+    How far the model puts the gripper from the measured squares, for their measured angles.
+    The root mean square distance is used: the hand measurements are only accurate to a
+    fraction of a square, every one of them.
+
+    INPUT:
+        measured -> Dictionary {"a8": [servo0, servo1, servo2, servo3], ...} (squares or "k0").
+        params, color, goDown -> As in angleTable, goDown is the depth the angles were measured at.
+        servoMap -> Servo map to use instead of SERVO_MAP.
+    OUTPUT:
+        error -> Root mean square distance in params units, infinite without measured squares.
+    '''
+    if not measured:
+        return np.inf
+    squares = list(measured)
+    targets = squarePoints(params, color, goDown)[[squareIndex(sq) for sq in squares], GRASP]
+    points = forwardKinematics([measured[sq] for sq in squares], params, servoMap=servoMap)
+    return float(np.sqrt(((points - targets) ** 2).sum(axis=1).mean()))
+
+def fitArm(measured, params, color, goDown, starts=20, iterations=150, seed=0):
+    '''
+    Fit ARM_GEOMETRY and SERVO_MAP to measured servo angles.
+
+    Levenberg-Marquardt on the forward kinematics distance to the measured squares, over
+    the link lengths, shoulder height, board offset and servo offsets, for every combination
+    of servo signs and `starts` random initial guesses. Mirrored solutions fit equally well,
+    the one with the upper arm raised and the elbow bent down (the branch of solveIK) is kept.
+
+    INPUT:
+        measured, params, color, goDown -> As in modelError.
+    OUTPUT:
+        geometry -> Dictionary with the ARM_GEOMETRY keys.
+        servoMap -> List of (offset, sign) for servos 0-3.
+        error -> modelError of the fitted model.
+    '''
+    squares = list(measured)
+    angles = np.array([measured[sq] for sq in squares], dtype=float)
+    targets = squarePoints({**params, "baseOffset": 0.0}, color, goDown)[[squareIndex(sq) for sq in squares], GRASP]
+    board = np.array([squareIndex(sq) < GRAVEYARD for sq in squares])  # The graveyard does not move with the board
+
+    def model(q, signs):
+        geometry = dict(zip(("upperArm", "forearm", "gripper", "shoulderHeight", "baseOffset"), q[:5]))
+        return geometry, list(zip(q[5:], signs))
+
+    def residuals(q, signs):
+        geometry, servoMap = model(q, signs)
+        shifted = targets.copy()
+        shifted[board, 0] += geometry["baseOffset"]
+        return (forwardKinematics(angles, params, geometry, servoMap) - shifted).ravel()
+
+    rng = np.random.default_rng(seed)
+    best = (np.inf, None, None)
+    for signs in np.array(np.meshgrid(*[[1, -1]] * 4)).T.reshape(-1, 4):
+        for _ in range(starts):
+            q = np.concatenate([rng.uniform(2, 12, 3), rng.uniform(0, 8, 1), rng.uniform(-12, 2, 1),
+                                [90], rng.uniform(-180, 360, 3)])
+            damping = 1e-2
+            cost = (residuals(q, signs) ** 2).sum()
+            for _ in range(iterations):
+                f = residuals(q, signs)
+                J = np.empty((len(f), len(q)))
+                for i in range(len(q)):
+                    dq = np.zeros(len(q))
+                    dq[i] = 1e-6
+                    J[:, i] = (residuals(q + dq, signs) - f) / 1e-6
+                A = J.T @ J
+                step = np.linalg.solve(A + damping * np.diag(np.diag(A) + 1e-9), -J.T @ f)
+                newCost = (residuals(q + step, signs) ** 2).sum()
+                if newCost < cost:
+                    q, cost = q + step, newCost
+                    damping /= 3
+                else:
+                    damping *= 3
+
+            joints = (angles - q[5:]) / signs
+            joints = (joints + 180) % 360 - 180
+            physical = np.all(q[:3] > 0) and np.median(joints[:, 1]) > 0 and np.median(joints[:, 2]) < 0
+            if physical and cost < best[0] - 1e-9:
+                best = (cost, q, signs)
+
+    cost, q, signs = best
+    if q is None:
+        raise ValueError("No arm model fits the measured squares")
+    # Offsets that put the measured joint angles in -180..180
+    q = q.copy()
+    median = np.median((angles - q[5:]) / signs, axis=0)
+    q[5:] += signs * (median - ((median + 180) % 360 - 180))
+    geometry, servoMap = model(q, signs)
+    geometry = {key: round(float(value), 2) for key, value in geometry.items()}
+    servoMap = [(round(float(offset), 2), int(sign)) for offset, sign in servoMap]
+    return geometry, servoMap, modelError(measured, {**params, **geometry}, color, goDown, servoMap)
+
+if __name__ == "__main__":
+    # Fit the arm model after changing ArmControl.square_angles, then copy the result
+    # into ARM_GEOMETRY and SERVO_MAP
+    import json
+    import ArmControl as ac
+    with open('params.txt') as json_file:
+        params = json.load(json_file)
+    measured = ac.measured_angles(ac.MEASURED_COLOR)
+    geometry, servoMap, error = fitArm(measured, params, ac.MEASURED_COLOR, ac.PICK_DEPTH * params["pieceHeight"])
+    print(f"ARM_GEOMETRY = {geometry}")
+    print(f"SERVO_MAP = {servoMap}")
+    print(f"Model error {error:.2f} (tolerance {ac.MODEL_TOLERANCE * params['sqSize']:.2f})")
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import contextvars
+import ArmControl as ac
+
+_token = contextvars.ContextVar("motionToken", default=None)  # Cancel token of the submitted move running in this task
+
+class MotionCancelled(Exception):
+    pass
+
+class MotionExecutor:
+    """
+    Non-blocking arm motion on an asyncio event loop.
+
+    Moves are coroutines that send one pose per control tick and yield to the loop in
+    between, so the GUI, vision and engine keep running. pause() holds the arm at its
+    current pose from the next tick on, resume() continues the same trajectory and
+    cancel() aborts the moves submitted so far, running or still queued; moves submitted
+    after it run normally (e.g. back to rest). Since ArmControl.current_angles is updated
+    every tick, the next move is planned from wherever the arm stopped.
+    pause/resume/cancel can be called from any thread.
+    """
+    def __init__(self):
+        self._clear = threading.Event()  # Set while the arm is allowed to move
+        self._clear.set()
+        self._tokens = set()  # Cancel tokens of the submitted moves not finished yet
+        self._lock = threading.Lock()
+        self.loop = None
+
+    # Control
+    def pause(self):
+        self._clear.clear()
+
+    def resume(self):
+        self._clear.set()
+
+    def cancel(self):
+        with self._lock:
+            for token in self._tokens:
+                token.set()
+        self._clear.set()
+
+    @property
+    def paused(self):
+        return not self._clear.is_set()
+
+    # Background loop for callers that are not async (e.g. the GUI worker threads)
+    def start(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self
+
+    def submit(self, coroutine):
+        """Schedule a move on the background loop with its own cancel token, returns a concurrent.futures.Future."""
+        self.start()
+        token = threading.Event()
+        with self._lock:
+            self._tokens.add(token)
+        return asyncio.run_coroutine_threadsafe(self._run(coroutine, token), self.loop)
+
+    async def _run(self, coroutine, token):
+        _token.set(token)
+        try:
+            return await coroutine
+        finally:
+            with self._lock:
+                self._tokens.discard(token)
+
+    # Moves
+    async def run_trajectory(self, trajectory, progress=None, done=0, total=None):
+        """
+        Play a sampled trajectory, one pose per tick.
+
+        Args:
+            trajectory (list): Poses of five angles.
+            progress (callable): Called as progress(ticksDone, ticksTotal) after every tick.
+            done (int): Ticks already done before this trajectory (for multi-step moves).
+            total (int): Ticks of the whole move, len(trajectory) by default.
+
+        Returns:
+            int: Ticks done at the end of this trajectory.
+        """
+        servoDriver = ac.get_driver()
+        tickTime = servoDriver.tick_period
+        total = len(trajectory) if total is None else total
+        token = _token.get()
+
+        for pose in trajectory:
+            while not self._clear.is_set():
+                await servoDriver.async_sleep(tickTime)
+            if token is not None and token.is_set():
+                raise MotionCancelled()
+
+            for i, angle in enumerate(pose):
+                if angle != ac.current_angles[i]:
+                    servoDriver.set_angle(i, angle)
+                    ac.current_angles[i] = angle
+            servoDriver.flush()
+            done += 1
+            if progress:
+                progress(done, total)
+            await servoDriver.async_sleep(tickTime)
+
+        return done
+
+    async def move_to_pose(self, target_pose, speed=1.0, progress=None):
+        """Awaitable ArmControl.move_to_pose, planned from the current pose."""
+        target = [ac.current_angles[i] if a is None else a for i, a in enumerate(target_pose)]
+        trajectory = ac.plan_pose_trajectory(ac.current_angles, target, speed, ac.get_driver().tick_period)
+        await self.run_trajectory(trajectory, progress)
+        return True
+
+    async def execute_move(self, move, params, color, progress=None):
+        """
+        Awaitable ArmControl.executeMove.
+
+        Args:
+            move (str): Sequence of squares (e.g., "e7k0e2e7").
+            params (dict): Physical parameters.
+            color (bool): Player color.
+            progress (callable): Called as progress(ticksDone, ticksTotal) after every tick.
+
+        Returns:
+            bool: True if the whole sequence was executed, False if a square is out of reach.
+            Raises MotionCancelled if cancel() was called after the move was submitted.
+        """
+        steps = ac.plan_move(move, params, color)
+        if steps is None:
+            return False
+
+        total = sum(len(trajectory) for _, trajectory in steps)
+        done = 0
+        for label, trajectory in steps:
+            print(label)
+            done = await self.run_trajectory(trajectory, progress, done, total)
+        return True
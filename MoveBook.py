@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import argparse
+import threading
+import chess
+import chess.pgn
+import chess.engine
+import chess.polyglot
+
+BOOK_FILE = 'games/book.bin'  # Polyglot opening book, optional
+CACHE_FILE = 'games/engine_cache.sqlite'
+
+class MoveBook:
+    """
+    Move sources checked before asking the engine.
+
+    The first level is a Polyglot opening book (weighted random choice among its moves),
+    the second an SQLite cache of engine results keyed by the Zobrist hash of the position,
+    the skill level and the search limit. store() adds engine results to the cache, so
+    repeated positions are only searched once, also across games.
+    """
+    def __init__(self, bookPath=BOOK_FILE, cachePath=CACHE_FILE):
+        self.book = None
+        if bookPath and os.path.isfile(bookPath):
+            self.book = chess.polyglot.open_reader(bookPath)
+        self.db = sqlite3.connect(cachePath, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (hash INTEGER, skill INTEGER, search TEXT, move TEXT, "
+                        "ponder TEXT, depth INTEGER, PRIMARY KEY (hash, skill, search))")
+        self.db.commit()
+        self._lock = threading.Lock()
+        self.bookHits = 0
+        self.cacheHits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(board, skill, limit):
+        key = chess.polyglot.zobrist_hash(board)
+        if key >= 1 << 63:  # SQLite integers are signed
+            key -= 1 << 64
+        seconds = None if limit.time is None else float(limit.time)
+        search = f"time={seconds},depth={limit.depth},nodes={limit.nodes}"
+        return key, int(skill), search
+
+    def lookup(self, board, skill, limit):
+        """Book or cached move for the position, as a chess.engine.PlayResult, None if there is none."""
+        if self.book is not None:
+            try:
+                entry = self.book.weighted_choice(board)
+                self.bookHits += 1
+                return chess.engine.PlayResult(entry.move, None, {"source": "book"})
+            except IndexError:
+                pass
+
+        with self._lock:
+            row = self.db.execute("SELECT move, ponder, depth FROM results WHERE hash=? AND skill=? AND search=?",
+                                  self._key(board, skill, limit)).fetchone()
+        if row:
+            move = chess.Move.from_uci(row[0])
+            if move in board.legal_moves:
+                self.cacheHits += 1
+                ponder = chess.Move.from_uci(row[1]) if row[1] else None
+                return chess.engine.PlayResult(move, ponder, {"source": "cache", "depth": row[2]})
+        self.misses += 1
+        return None
+
+    def store(self, board, skill, limit, result):
+        if result.move is None or result.info.get("source") in ("book", "cache"):
+            return
+        ponder = result.ponder.uci() if result.ponder else None
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                            self._key(board, skill, limit) + (result.move.uci(), ponder, result.info.get("depth")))
+            self.db.commit()
+
+    def stats(self):
+        lookups = self.bookHits + self.cacheHits + self.misses
+        return {"book": self.bookHits, "cache": self.cacheHits, "misses": self.misses,
+                "hitRate": (self.bookHits + self.cacheHits) / lookups if lookups else 0.0}
+
+    def prewarm(self, engine, pgnPaths, skill, limit, plies=30):
+        """
+        Search every position of the PGN games (first plies half-moves) that is not in the
+        book or the cache yet. Returns the number of positions searched.
+        """
+        searched = 0
+        for path in pgnPaths:
+            with open(path) as pgn:
+                while True:
+                    game = chess.pgn.read_game(pgn)
+                    if game is None:
+                        break
+                    board = game.board()
+                    for ply, move in enumerate(game.mainline_moves()):
+                        if ply >= plies:
+                            break
+                        if self.lookup(board, skill, limit) is None:
+                            self.store(board, skill, limit, engine.play(board, limit, info=chess.engine.INFO_BASIC))
+                            searched += 1
+                        board.push(move)
+        return searched
+
+    def close(self):
+        if self.book is not None:
+            self.book.close()
+        self.db.close()
+
+if __name__ == "__main__":
+    # Fill the engine cache from PGN files, e.g.
+    # python MoveBook.py /usr/games/stockfish pieces_images/game.pgn --skill 20 --time 1
+    parser = argparse.ArgumentParser(description="Pre-warm the engine result cache from PGN games")
+    parser.add_argument("engine", help="UCI engine executable")
+    parser.add_argument("pgn", nargs="+", help="PGN files")
+    parser.add_argument("--skill", type=int, default=20, help="Engine Skill Level")
+    parser.add_argument("--time", type=float, default=1.0, help="Search time per move in seconds")
+    parser.add_argument("--plies", type=int, default=30, help="Half-moves of each game to search")
+    args = parser.parse_args()
+
+    engine = chess.engine.SimpleEngine.popen_uci(args.engine)
+    engine.configure({"Skill Level": args.skill})
+    book = MoveBook()
+    try:
+        searched = book.prewarm(engine, args.pgn, args.skill, chess.engine.Limit(time=args.time), args.plies)
+        print(f"{searched} positions searched, {book.stats()}")
+    finally:
+        engine.quit()
+        book.close()
@@ -0,0 +1,194 @@
+import time
+import asyncio
+
+# PCA9685 channels used by the arm joints (servo 0-4 on channels 1-5)
+SERVO_CHANNELS = [1, 2, 3, 4, 5]
+
+# PCA9685 registers
+MODE1 = 0x00
+PRESCALE = 0xFE
+LED0_ON_L = 0x06  # LEDn_ON_L = LED0_ON_L + 4 * n, followed by ON_H, OFF_L, OFF_H
+MODE1_SLEEP = 0x10
+MODE1_AI = 0x20  # Register auto-increment
+MODE1_RESTART = 0x80
+OSC_CLOCK = 25000000  # Internal oscillator in Hz
+
+class ServoDriver:
+    """
+    Common interface for the arm servo backends.
+
+    The motion code stages the angles of one control tick with set_angle(), sends
+    them with flush() and waits tick_period seconds with sleep(), so it never talks
+    to the hardware directly.
+    """
+    def __init__(self, tick_rate=50):
+        self.tick_rate = tick_rate  # Control ticks per second
+
+    @property
+    def tick_period(self):
+        return 1.0 / self.tick_rate
+
+    def set_angle(self, joint, angle):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def now(self):
+        return time.monotonic()
+
+    def deinit(self):
+        pass
+
+class PCA9685Driver(ServoDriver):
+    """
+    Servos connected to a PCA9685 PWM board on the I2C bus.
+
+    Angles set during a tick are only converted to pulse counts; flush() writes all
+    of them in one auto-increment burst starting at the first changed LEDn_ON_L
+    register, instead of one I2C transaction per servo. With batched=False every
+    channel gets its own transaction, which is what the adafruit servo objects do.
+    """
+    def __init__(self, channels=SERVO_CHANNELS, address=0x40, frequency=50, min_pulse=500, max_pulse=2500,
+                 tick_rate=50, batched=True, i2c=None):
+        super().__init__(tick_rate)
+        if i2c is None:
+            # Hardware libraries are only needed (and only available) on the Pi
+            from board import SCL, SDA
+            import busio
+            i2c = busio.I2C(SCL, SDA)
+
+        self.i2c = i2c
+        self.address = address
+        self.channels = list(channels)
+        self.frequency = frequency
+        self.min_pulse = min_pulse
+        self.max_pulse = max_pulse
+        self.batched = batched
+        self.counts = [None] * 16  # Last OFF count written to each channel
+        self.pending = {}  # channel -> OFF count staged for the next flush
+
+        self._write(bytes([MODE1, 0x00]))  # Reset
+        prescale = int(OSC_CLOCK / 4096.0 / frequency + 0.5) - 1
+        self._write(bytes([MODE1, MODE1_SLEEP]))  # Prescale can only be set while sleeping
+        self._write(bytes([PRESCALE, prescale]))
+        self._write(bytes([MODE1, 0x00]))
+        time.sleep(0.005)
+        self._write(bytes([MODE1, MODE1_RESTART | MODE1_AI]))
+
+    def _write(self, buffer):
+        while not self.i2c.try_lock():
+            pass
+        try:
+            self.i2c.writeto(self.address, buffer)
+        finally:
+            self.i2c.unlock()
+
+    def angle_to_count(self, angle):
+        pulse = self.min_pulse + (self.max_pulse - self.min_pulse) * angle / 180
+        return int(round(pulse * self.frequency * 4096 / 1000000))
+
+    def set_angle(self, joint, angle):
+        self.pending[self.channels[joint]] = self.angle_to_count(angle)
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        if not self.batched:
+            for channel, count in sorted(self.pending.items()):
+                self._write(bytes([LED0_ON_L + 4 * channel, 0, 0, count & 0xFF, count >> 8]))
+                self.counts[channel] = count
+            self.pending = {}
+            return
+
+        # One burst per run of consecutive channels; unchanged channels inside the run are rewritten
+        channels = sorted(self.pending)
+        run = []
+        for channel in range(channels[0], channels[-1] + 1):
+            if channel in self.pending or self.counts[channel] is not None:
+                run.append(channel)
+            else:
+                self._burst(run)
+                run = []
+        self._burst(run)
+        self.pending = {}
+
+    def _burst(self, run):
+        if not run:
+            return
+        buffer = bytearray([LED0_ON_L + 4 * run[0]])
+        for channel in run:
+            count = self.pending.get(channel, self.counts[channel])
+            buffer += bytes([0, 0, count & 0xFF, count >> 8])
+            self.counts[channel] = count
+        self._write(bytes(buffer))
+
+    def deinit(self):
+        self._write(bytes([MODE1, 0x00]))
+        if hasattr(self.i2c, "deinit"):
+            self.i2c.deinit()
+
+class FakeI2CBus:
+    """
+    Stand-in for busio.I2C that only counts traffic.
+
+    Each writeto() is one transaction of len(buffer) data bytes plus the address byte.
+    """
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.log = []
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        data = bytes(buffer[start:end])
+        self.transactions += 1
+        self.bytes += len(data) + 1
+        self.log.append((address, data))
+
+    def reset(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.log = []
+
+class SimulatedDriver(ServoDriver):
+    """
+    In-memory arm running on a virtual clock.
+
+    Every write is stored in `writes` as (timestamp, joint, angle) and sleep() only
+    advances the clock, so whole games can be replayed without hardware or waiting.
+    """
+    def __init__(self, joints=len(SERVO_CHANNELS), start=0.0, tick_rate=50):
+        super().__init__(tick_rate)
+        self.clock = start
+        self.angles = [None] * joints
+        self.writes = []
+
+    def set_angle(self, joint, angle):
+        self.angles[joint] = angle
+        self.writes.append((self.clock, joint, angle))
+
+    def sleep(self, seconds):
+        self.clock += seconds
+
+    async def async_sleep(self, seconds):
+        self.clock += seconds
+        await asyncio.sleep(0)
+
+    def now(self):
+        return self.clock
+
+    def reset(self):
+        self.writes = []
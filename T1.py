@@ -1,22 +1,7 @@
-import time
-from board import SCL, SDA
-import busio
-from adafruit_pca9685 import PCA9685
-from adafruit_motor import servo
-
-# Setup I2C and PCA9685
-i2c = busio.I2C(SCL, SDA)
-pca = PCA9685(i2c, address=0x40)
-pca.frequency = 50  # Set PWM frequency to 50 Hz for servos
-
-# Initialize servos on channels 1-5 (servo 0-4)
-servos = [
-    servo.Servo(pca.channels[1], min_pulse=500, max_pulse=2500),  # Servo 0 (MG995)
-    servo.Servo(pca.channels[2], min_pulse=500, max_pulse=2500),  # Servo 1 (MG995)
-    servo.Servo(pca.channels[3], min_pulse=500, max_pulse=2500),  # Servo 2 (MG995)
-    servo.Servo(pca.channels[4], min_pulse=500, max_pulse=2500),  # Servo 3 (MG90S)
-    servo.Servo(pca.channels[5], min_pulse=500, max_pulse=2500),  # Servo 4 (MG90S)
-]
+import ServoDriver as sd
+
+# Servo backend, opened when run as a script so this module imports off the Pi
+driver = None
 
 # Global list to track current angles of each servo
 current_angles = [90, 90, 30, 90, 20]  # Initial angles
@@ -47,10 +32,11 @@ def move_servo_slowly(servo_num, target_angle):
                 intermediate_angle = target_angle
 
         try:
-            servos[servo_num].angle = intermediate_angle
+            driver.set_angle(servo_num, intermediate_angle)
+            driver.flush()
             print(f"Set servo {servo_num} (channel {servo_num+1}) to {intermediate_angle:.1f} degrees")
             current_angles[servo_num] = intermediate_angle
-            time.sleep(0.04)  # Delay of 0.04 seconds for every 1-degree change
+            driver.sleep(0.04)  # Delay of 0.04 seconds for every 1-degree change
         except Exception as e:
             print(f"Error setting servo {servo_num} to {intermediate_angle:.1f} degrees: {e}")
             return
@@ -58,10 +44,11 @@ def move_servo_slowly(servo_num, target_angle):
     # Ensure the final angle is exactly the target
     if current_angles[servo_num] != target_angle:
         try:
-            servos[servo_num].angle = target_angle
+            driver.set_angle(servo_num, target_angle)
+            driver.flush()
             print(f"Set servo {servo_num} (channel {servo_num+1}) to {target_angle:.1f} degrees (final)")
             current_angles[servo_num] = target_angle
-            time.sleep(0.04)
+            driver.sleep(0.04)
         except Exception as e:
             print(f"Error setting servo {servo_num} to {target_angle:.1f} degrees (final): {e}")
 
@@ -114,10 +101,11 @@ def main():
         move_servo_slowly(i, angle)
 
     # Deinitialize PCA9685
-    pca.deinit()
+    driver.deinit()
     print("PCA9685 deinitialized")
 
 if __name__ == "__main__":
+    driver = sd.PCA9685Driver()
     try:
         main()
     except KeyboardInterrupt:
@@ -125,8 +113,8 @@ if __name__ == "__main__":
         # Clean up: Return to initial positions
         for i, angle in enumerate([90, 90, 30, 90, 20]):
             move_servo_slowly(i, angle)
-        pca.deinit()
+        driver.deinit()
         print("PCA9685 deinitialized")
     finally:
-        pca.deinit()
+        driver.deinit()
         print("PCA9685 deinitialized")
\ No newline at end of file
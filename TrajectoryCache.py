@@ -0,0 +1,90 @@
+import os
+import pickle
+import threading
+import hashlib
+import json
+from collections import OrderedDict
+
+class TrajectoryCache:
+    """
+    Bounded LRU cache of sampled arm trajectories.
+
+    Keys are (fromSquare, toSquare, gripAngle). Every entry belongs to one calibration,
+    identified by a fingerprint of the physical parameters and the angle table: when the
+    fingerprint changes the cache is emptied, and a saved cache is only loaded back if
+    it was built for the current calibration. `dirty` tells whether entries were added
+    since the last load or save.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._saveLock = threading.Lock()
+
+    def calibrate(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            self.entries.clear()
+            self.fingerprint = fingerprint
+            self.dirty = False
+
+    def get(self, key):
+        trajectory = self.entries.get(key)
+        if trajectory is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return trajectory
+
+    def put(self, key, trajectory):
+        self.entries[key] = trajectory
+        self.entries.move_to_end(key)
+        self.dirty = True
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def full(self):
+        return len(self.entries) >= self.maxsize
+
+    def snapshot(self):
+        # Cheap copy of the entry references, can be pickled while the cache keeps changing
+        self.dirty = False
+        return {"fingerprint": self.fingerprint, "entries": list(self.entries.items())}
+
+    def save(self, path, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        # Written next to the target and renamed, a reader never sees a partial file
+        with self._saveLock:
+            with open(path + '.tmp', 'wb') as outfile:
+                pickle.dump(snapshot, outfile)
+            os.replace(path + '.tmp', path)
+
+    def load(self, path, fingerprint):
+        """Load a saved cache if it matches the current calibration, returns the number of entries loaded."""
+        self.calibrate(fingerprint)
+        if not os.path.isfile(path):
+            return 0
+        try:
+            with open(path, 'rb') as infile:
+                data = pickle.load(infile)
+        except Exception as e:
+            print(f"Error loading trajectory cache {path}: {e}")
+            return 0
+        if data.get("fingerprint") != fingerprint:
+            print("Trajectory cache on disk belongs to another calibration, ignoring it")
+            return 0
+        for key, trajectory in data["entries"][-self.maxsize:]:
+            self.put(key, trajectory)
+        self.dirty = False
+        return len(self.entries)
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+def fingerprint(*calibration):
+    """Stable hash of any JSON-serializable calibration data."""
+    return hashlib.sha1(json.dumps(calibration, sort_keys=True).encode()).hexdigest()
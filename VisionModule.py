@@ -3,6 +3,7 @@ import numpy as np
 import string
 import time
 import os
+import threading
 
 def findTransformation(img, cbPattern):
     patternSize = (7, 7)
@@ -30,6 +31,38 @@ def applyHomography(img, H):
     
     return imgNEW
 
+class BoardWarp:
+    """
+    applyHomography followed by applyRotation as a single cv2.remap.
+
+    The rotation is folded into the homography once (fuseRotation) and the combined
+    mapping is turned into lookup tables, in fixed point (CV_16SC2) by default, so a
+    frame costs one remap instead of two full-image warps. apply() writes into `out`
+    when it is a matching array, which lets the caller reuse its image buffers.
+    """
+    def __init__(self, H, R=None, size=400, fixedPoint=True):
+        self.size = size
+        Minv = np.linalg.inv(fuseRotation(H, R, size))
+        u, v = np.meshgrid(np.arange(size, dtype=np.float64), np.arange(size, dtype=np.float64))
+        src = Minv @ np.stack([u.ravel(), v.ravel(), np.ones(size * size)])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mapX = (src[0] / src[2]).reshape(size, size).astype(np.float32)
+            mapY = (src[1] / src[2]).reshape(size, size).astype(np.float32)
+        mapX[~np.isfinite(mapX)] = -1
+        mapY[~np.isfinite(mapY)] = -1
+
+        if fixedPoint:
+            self.map1, self.map2 = cv2.convertMaps(mapX, mapY, cv2.CV_16SC2)
+        else:
+            self.map1, self.map2 = mapX, mapY
+
+    def apply(self, img, out=None):
+        shape = (self.size, self.size) + img.shape[2:]
+        if not isinstance(out, np.ndarray) or out.shape != shape or out.dtype != img.dtype:
+            out = np.empty(shape, dtype=img.dtype)
+        cv2.remap(img, self.map1, self.map2, cv2.INTER_LINEAR, dst=out)
+        return out
+
 def drawQuadrants(img):
     # Draw quadrants and numbers on image
     imgquad = img.copy()
@@ -50,24 +83,21 @@ def findRotation(theta):
 
     return rotMAT
 
+def squareScores(img1, img2, size=50):
+    # L2 distance between the two images on each of the 64 squares, computed in one reduction.
+    # scores[row, col] belongs to the square with letter row and number col + 1.
+    diff = cv2.absdiff(img1, img2).astype(np.float32)
+    diff *= diff
+    return np.sqrt(diff.reshape(8, size, 8, -1).sum(axis=(1, 3)))
+
 def findMoves(img1, img2):
     size = 50
-    img1SQ = img2SQ = []
-    largest = [0, 0, 0, 0]
-    coordinates = [0, 0, 0, 0]
-    for y in range(0, 8*size, size):
-        for x in range(0, 8*size, size):
-            img1SQ = img1[x:x+size, y:y+size]
-            img2SQ = img2[x:x+size, y:y+size]
-            dist = cv2.norm(img2SQ, img1SQ)
-            for z in range(0, 4):
-                if dist >= largest[z]:
-                    largest.insert(z, dist)
-                    # Save in algebraic chess notation
-                    coordinates.insert(z, (string.ascii_lowercase[int(x/size)] + str(int(y/size + 1))))
-                    largest.pop()
-                    coordinates.pop()
-                    break
+    scores = squareScores(img1, img2, size)
+
+    # Rank the squares by change, columns first like the square by square scan did
+    order = np.argsort(-scores.T.ravel(), kind='stable')[:4]
+    largest = [scores.T.flat[i] for i in order]
+    coordinates = [string.ascii_lowercase[i % 8] + str(i // 8 + 1) for i in order]
 
     # Make threshold with a percentage of the change in color of the biggest two
     thresh = (largest[0] + largest[1]) / 2 * (0.5)
@@ -75,33 +105,337 @@ def findMoves(img1, img2):
         if largest[t] < thresh:
             coordinates.pop()
     
-    return coordinates
+    return coordinates, scores
+
+def bitboard(flags):
+    # (8, 8) booleans indexed [letter, number - 1] to a 64-bit int, bit n = python-chess square n
+    return int.from_bytes(np.packbits(np.asarray(flags).T.ravel(), bitorder='little').tobytes(), 'little')
+
+class BoardClassifier:
+    """
+    Empty / white / black classification of the 64 squares of a warped board image.
+
+    Works on colour statistics in one batched pass: the centre of every square is
+    compared with the same square of the empty board (from the calibration frames).
+    A square is occupied when enough of its centre differs from the empty board, and
+    the piece is white when those differing pixels are brighter than colourThresh.
+    calibrate() fits both thresholds on a position whose occupancy is known, e.g. the
+    start position right after the board is set up.
+    """
+    def __init__(self, empty, size=50, margin=12, pixelThresh=30, occupancyThresh=0.2, colourThresh=128):
+        self.size = size
+        self.margin = margin  # Pixels left out on every side of the square (neighbouring pieces, grid lines)
+        self.pixelThresh = pixelThresh
+        self.occupancyThresh = occupancyThresh
+        self.colourThresh = colourThresh
+        self.empty = self._centres(empty)
+
+    def _centres(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        s, m = self.size, self.margin
+        return gray.reshape(8, s, 8, s)[:, m:s - m, :, m:s - m].astype(np.int16)
+
+    def features(self, img):
+        # Fraction of the centre that differs from the empty board and mean brightness of those pixels
+        centres = self._centres(img)
+        changed = np.abs(centres - self.empty) > self.pixelThresh
+        count = changed.sum(axis=(1, 3))
+        area = count / (changed.shape[1] * changed.shape[3])
+        brightness = (centres * changed).sum(axis=(1, 3)) / np.maximum(count, 1)
+        return area, brightness
+
+    def classify(self, img):
+        """
+        INPUT:
+            img -> Warped board (400x400), rows a-h and columns 1-8 like findMoves.
+        OUTPUT:
+            (occupied, white) -> 64-bit bitboards in python-chess square order, comparable with
+                                 board.occupied and board.occupied_co[chess.WHITE].
+        """
+        area, brightness = self.features(img)
+        occupied = area > self.occupancyThresh
+        return bitboard(occupied), bitboard(occupied & (brightness > self.colourThresh))
+
+    def calibrate(self, img, occupied, white):
+        # Fit the thresholds on a position with known occupied and white bitboards
+        area, brightness = self.features(img)
+        bits = np.array([(occupied >> n) & 1 for n in range(64)], dtype=bool).reshape(8, 8).T
+        whites = np.array([(white >> n) & 1 for n in range(64)], dtype=bool).reshape(8, 8).T
+        if bits.any() and (~bits).any():
+            self.occupancyThresh = (area[~bits].max() + area[bits].min()) / 2
+        blacks = bits & ~whites
+        if whites.any() and blacks.any():
+            self.colourThresh = (np.median(brightness[whites]) + np.median(brightness[blacks])) / 2
+
+CB_PATTERN = 'interface_images/cb_pattern.jpg'
+cbPattern = None  # Loaded once by loadPattern()
+
+def loadPattern():
+    global cbPattern
+    if cbPattern is None:
+        cbPattern = cv2.imread(os.getcwd() + '/' + CB_PATTERN, cv2.IMREAD_GRAYSCALE)
+    return cbPattern
+
+WATCH_SIZE = 64  # Side in pixels of the downsampled board used by the safety checks (8 px per square)
+
+def fuseRotation(H, R=None, size=400):
+    # 3x3 matrix doing applyHomography(img, H) followed by applyRotation(img, R) in one warp
+    M = np.asarray(H, dtype=np.float64)
+    if R is not None and np.asarray(R).any() != 0:
+        M = np.vstack([R, [0, 0, 1]]) @ M
+    return M
+
+def edgeZone(playerColor=True, band=2):
+    # Mask of the band of ranks along the human's edge of the board, a hand has to cross it to reach the board
+    # Ranks run along the image columns, rank 1 on the left (findMoves coordinates)
+    cell = WATCH_SIZE // 8
+    zone = np.zeros((WATCH_SIZE, WATCH_SIZE), dtype=bool)
+    if playerColor:
+        zone[:, :band * cell] = True
+    else:
+        zone[:, -band * cell:] = True
+    return zone
+
+def longestRun(flags):
+    # Length of the longest run of True in a 1-D boolean array
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], np.asarray(flags, dtype=np.int8), [0]))))
+    return int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+
+def watchImage(img, M, size=WATCH_SIZE, oversample=4):
+    # Board area of a camera frame, gray, warped straight to oversample * size, averaged down to size x size
+    # and blurred. warpPerspective has no area interpolation (INTER_AREA falls back to bilinear), warping
+    # straight to size would point-sample the frame and keep the camera noise
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    warp = oversample * size
+    S = np.diag([warp / 400, warp / 400, 1])
+    board = cv2.warpPerspective(gray, S @ M, (warp, warp))
+    small = cv2.resize(board, (size, size), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (5, 5), 0)
+
+class SafetyCheck:
+    """
+    Cheap "clear / obstructed" decision for a camera frame.
+
+    The frame is warped straight to a small blurred gray image of the board and compared
+    with a reference of the board (empty or with pieces) taken while nothing was in the
+    way. The board is obstructed when more than areaThresh of the pixels inside mask
+    differ by more than pixelThresh. Every check is timed: lastTime, maxTime and
+    overBudget (checks slower than budget seconds) show if it keeps up with the camera.
+    """
+    def __init__(self, H, R=None, budget=0.005, pixelThresh=30, areaThresh=0.05):
+        self.H = np.asarray(H)
+        self.M = fuseRotation(H, R)
+        self.budget = budget
+        self.pixelThresh = pixelThresh
+        self.areaThresh = areaThresh
+        self.mask = np.ones((WATCH_SIZE, WATCH_SIZE), dtype=bool)
+        self.reference = None
+        self.lastTime = 0.0
+        self.maxTime = 0.0
+        self.checks = 0
+        self.overBudget = 0
+
+    def setReference(self, img):
+        self.reference = watchImage(img, self.M)
+
+    def obstructed(self, img):
+        start = time.perf_counter()
+        small = watchImage(img, self.M)
+        if self.reference is None:
+            self.reference = small
+        changed = cv2.absdiff(small, self.reference) > self.pixelThresh
+        area = np.count_nonzero(changed & self.mask) / max(np.count_nonzero(self.mask), 1)
+
+        self.lastTime = time.perf_counter() - start
+        self.maxTime = max(self.maxTime, self.lastTime)
+        self.checks += 1
+        if self.lastTime > self.budget:
+            self.overBudget += 1
+        return area > self.areaThresh
+
+    def isClear(self, img):
+        return not self.obstructed(img)
+
+safety = None  # SafetyCheck used by safetoMove
+
+def setSafetyReference(img, H):
+    # Reference frame for safetoMove, take it while the board is clear
+    global safety
+    if safety is None or not np.array_equal(safety.H, H):
+        safety = SafetyCheck(H)
+    safety.setReference(img)
 
 def safetoMove(H, cap, selectedCam):
-    cbPattern = cv2.imread(os.getcwd() + '/' + 'interface_images/cb_pattern.jpg', cv2.IMREAD_GRAYSCALE)
+    global safety
+    if safety is None or not np.array_equal(safety.H, H):
+        safety = SafetyCheck(H)
     
-    # Clear images stored in buffer
-    for i in range(5):
-        cap.grab()
+    # Clear images stored in buffer (a CaptureService has none)
+    if hasattr(cap, "grab"):
+        for i in range(5):
+            cap.grab()
     
-    # Capture a frame from the USB webcam
+    # Capture a frame from the camera
     ret, img = cap.read()
     if not ret:
         print("Error: Failed to capture frame from webcam")
         return False
 
-    img = cv2.warpPerspective(img, H, (cbPattern.shape[1], cbPattern.shape[0]))
+    return safety.isClear(img)
+
+class MoveDetector:
+    """
+    Event-driven detection of the human move on the camera stream.
+
+    Every frame is reduced to the small board image of the safety checks. Motion between
+    consecutive frames means a hand is over the board; once it has gone and the scene has
+    been still for settleTime seconds, the squares that differ from the reference (the
+    board before the move) are counted. feed() returns True when 1 to maxSquares squares
+    changed and the band along the human's edge (the BoardWatcher zone) matches the
+    reference apart from those squares, i.e. a move is on the board and the frame can go
+    to findMoves. More changed squares means something is still resting on the board, a
+    changed band, or a run of more than edgeThresh of a square's width changed along the
+    edge itself, means an arm still reaching in (possibly holding a piece still), none means
+    the hand left without moving anything.
+    """
+    def __init__(self, H, R=None, playerColor=True, band=2, pixelThresh=30, motionThresh=0.01, squareThresh=0.2,
+                 bandThresh=0.02, edgeThresh=0.5, settleTime=0.5, maxSquares=4):
+        self.M = fuseRotation(H, R)
+        self.zone = edgeZone(playerColor, band)
+        self.edge = 0 if playerColor else -1  # Image column along the human's edge
+        self.pixelThresh = pixelThresh
+        self.motionThresh = motionThresh  # Fraction of moving pixels between two frames
+        self.squareThresh = squareThresh  # Fraction of changed pixels for a square to count as changed
+        self.bandThresh = bandThresh  # Fraction of changed pixels allowed in the band outside the changed squares
+        self.edgeThresh = edgeThresh  # Fraction of a square's width a changed run along the human's edge may span
+        self.settleTime = settleTime  # Seconds the scene has to be still
+        self.maxSquares = maxSquares  # Castling changes 4 squares
+        self.reset()
+
+    def reset(self, img=None):
+        # New reference, the next frame is used if img is None
+        self.reference = None if img is None else watchImage(img, self.M)
+        self.previous = self.reference
+        self.active = False  # Something moved over the board since the reference
+        self.stillSince = None  # Time of the first still frame after the motion
+        self.lastStamp = None
+
+    def changedSquares(self, small):
+        cell = WATCH_SIZE // 8
+        changed = cv2.absdiff(small, self.reference) > self.pixelThresh
+        return changed.reshape(8, cell, 8, cell).mean(axis=(1, 3)) > self.squareThresh
+
+    def bandClear(self, small, squares):
+        # The human's edge band matches the reference outside the changed squares, and no arm
+        # crosses the edge itself (pieces stay inside their squares)
+        cell = WATCH_SIZE // 8
+        changed = cv2.absdiff(small, self.reference) > self.pixelThresh
+        outside = self.zone & ~np.kron(squares, np.ones((cell, cell), dtype=bool))
+        return (np.count_nonzero(changed & outside) <= self.bandThresh * np.count_nonzero(self.zone)
+                and longestRun(changed[:, self.edge]) <= self.edgeThresh * cell)
+
+    def feed(self, img, stamp=None):
+        """Next camera frame, stamp is its time.monotonic() capture time (now if None)."""
+        if stamp is not None:
+            if stamp == self.lastStamp:
+                return False
+            self.lastStamp = stamp
+        now = time.monotonic() if stamp is None else stamp
+
+        small = watchImage(img, self.M)
+        if self.reference is None:
+            self.reference = self.previous = small
+            return False
+        motion = np.count_nonzero(cv2.absdiff(small, self.previous) > self.pixelThresh) / small.size
+        self.previous = small
+
+        if motion > self.motionThresh:
+            self.active = True
+            self.stillSince = None
+            return False
+        if not self.active:
+            return False
+        if self.stillSince is None:
+            self.stillSince = now
+        if now - self.stillSince < self.settleTime:
+            return False
+
+        squares = self.changedSquares(small)
+        changed = np.count_nonzero(squares)
+        if changed == 0:
+            self.active = False
+        elif changed <= self.maxSquares and self.bandClear(small, squares):
+            self.active = False
+            return True
+        return False
+
+class BoardWatcher:
+    """
+    Background obstacle monitor used while the arm moves.
+
+    Every camera frame goes through a SafetyCheck against a reference taken when the
+    watcher starts. Only a band of squares along the human's edge of the board is
+    watched (a hand has to cross it to reach the board) and the squares the arm itself
+    visits are masked out. When the band is obstructed onObstructed() is called, and
+    onClear() once it has been clear for clearFrames frames in a row.
+    """
+    def __init__(self, grabFrame, H, R, onObstructed, onClear, playerColor=True, band=2, clearFrames=3):
+        self.grabFrame = grabFrame
+        self.safety = SafetyCheck(H, R)
+        self.onObstructed = onObstructed
+        self.onClear = onClear
+        self.clearFrames = clearFrames
+        self.obstructed = False
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.zone = edgeZone(playerColor, band)
+        self.safety.mask = self.zone.copy()
+
+    def ignore(self, squares):
+        # Mask out the squares the arm goes to (and their neighbours)
+        cell = WATCH_SIZE // 8
+        mask = self.zone.copy()
+        for square in squares:
+            if square[0] not in string.ascii_lowercase[:8]:
+                continue
+            row = string.ascii_lowercase.index(square[0])
+            col = int(square[1]) - 1
+            mask[max(row - 1, 0) * cell:(row + 2) * cell, max(col - 1, 0) * cell:(col + 2) * cell] = False
+        self.safety.mask = mask
 
-    # Kmeans algorithm (Map the image to only two colors)
-    K = 2
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-    Z = np.float32(img.reshape((-1, 3)))
-    ret, label, center = cv2.kmeans(Z, K, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-    center = np.uint8(center)
-    res = center[label.flatten()].reshape((img.shape))
-    imgGRAY = cv2.cvtColor(res, cv2.COLOR_BGR2GRAY)
+    def start(self):
+        self._stop.clear()
+        self.safety.reference = None  # The first frame becomes the reference
+        self.obstructed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
 
-    # Try to find chessboard corners (if there's an obstacle it won't be able to do so)
-    retIMG, cornersIMG = cv2.findChessboardCorners(imgGRAY, (7, 7), cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_FAST_CHECK + cv2.CALIB_CB_NORMALIZE_IMAGE)
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        if self.obstructed:
+            self.obstructed = False
+            self.onClear()
 
-    return retIMG
+    def _run(self):
+        clear = 0
+        while not self._stop.is_set():
+            ret, img = self.grabFrame()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            if self.safety.obstructed(img):
+                clear = 0
+                if not self.obstructed:
+                    print("Obstacle detected, pausing the arm")
+                    self.obstructed = True
+                    self.onObstructed()
+            elif self.obstructed:
+                clear += 1
+                if clear >= self.clearFrames:
+                    print("Board clear, resuming the arm")
+                    self.obstructed = False
+                    self.onClear()
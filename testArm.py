@@ -1,22 +1,9 @@
-import time
-from board import SCL, SDA
-import busio
-from adafruit_pca9685 import PCA9685
-from adafruit_motor import servo
-
-# Setup I2C and PCA9685
-i2c = busio.I2C(SCL, SDA)
-pca = PCA9685(i2c, address=0x40)
-pca.frequency = 50  # Set PWM frequency to 50 Hz for servos
-
-# Initialize servos on channels 1-5 (servo 0-4)
-servos = [
-    servo.Servo(pca.channels[1], min_pulse=500, max_pulse=2500),  # Servo 0 (MG995, Base)
-    servo.Servo(pca.channels[2], min_pulse=500, max_pulse=2500),  # Servo 1 (MG995, Shoulder)
-    servo.Servo(pca.channels[3], min_pulse=500, max_pulse=2500),  # Servo 2 (MG995, Elbow)
-    servo.Servo(pca.channels[4], min_pulse=500, max_pulse=2500),  # Servo 3 (MG90S, Wrist)
-    servo.Servo(pca.channels[5], min_pulse=500, max_pulse=2500),  # Servo 4 (MG90S, Gripper)
-]
+import ServoDriver as sd
+import Calibration as cal
+import numpy as np
+
+# Servo backend, opened when run as a script so this module imports off the Pi
+driver = None
 
 # Interpolation functions from your original ArmControl.py
 def interpolate_servo0(file_num):
@@ -47,38 +34,28 @@ def interpolate_servo2(rank):
         east_angle = east_rank4 + (east_rank4 - east_rank1) / 3 * (rank - 4)
         return min((west_angle + east_angle) / 2, 180)
 
+# Servo 1 and 3 angles measured on the corner squares (bot's perspective),
+# interpolated once over the whole board
+SERVO1_3_CORNERS = {
+    "a1": (180, 180),
+    "a4": (180, 155),
+    "h1": (170, 180),
+    "h4": (180, 160),
+    "d1": (140, 160),
+    "d4": (170, 160),
+    "e1": (140, 160),
+    "e4": (170, 160),
+}
+SERVO1_3_TABLE = np.clip(cal.fitSurface(SERVO1_3_CORNERS, "bilinear"), 0, 180)
+
 def interpolate_servo1_and_3(file_num, rank):
-    corners = {
-        (1, 1): (180, 180),  # a1
-        (1, 4): (180, 155),  # a4
-        (8, 1): (170, 180),  # h1
-        (8, 4): (180, 160),  # h4
-        (4, 1): (140, 160),  # d1
-        (4, 4): (170, 160),  # d4
-        (5, 1): (140, 160),  # e1
-        (5, 4): (170, 160),  # e4
-    }
-    file_points = sorted(set(f for f, _ in corners.keys()))
-    rank_points = sorted(set(r for _, r in corners.keys()))
-    f0 = max([f for f in file_points if f <= file_num], default=file_points[0])
-    f1 = min([f for f in file_points if f >= file_num], default=file_points[-1])
-    r0 = max([r for r in rank_points if r <= rank], default=rank_points[0])
-    r1 = min([r for r in rank_points if r >= rank], default=rank_points[-1])
-    s1_00, s3_00 = corners.get((f0, r0), (170, 160))
-    s1_01, s3_01 = corners.get((f0, r1), (170, 160))
-    s1_10, s3_10 = corners.get((f1, r0), (170, 160))
-    s1_11, s3_11 = corners.get((f1, r1), (170, 160))
-    if f1 == f0:
-        t = 0
-    else:
-        t = (file_num - f0) / (f1 - f0)
-    if r1 == r0:
-        u = 0
-    else:
-        u = (rank - r0) / (r1 - r0)
-    servo1 = (1 - t) * (1 - u) * s1_00 + t * (1 - u) * s1_10 + (1 - t) * u * s1_01 + t * u * s1_11
-    servo3 = (1 - t) * (1 - u) * s3_00 + t * (1 - u) * s3_10 + (1 - t) * u * s3_01 + t * u * s3_11
-    return (min(max(servo1, 0), 180), min(max(servo3, 0), 180))
+    servo1, servo3 = SERVO1_3_TABLE[(file_num - 1) + 8 * (rank - 1)]
+    return (servo1, servo3)
+
+def set_servo(servo_num, angle):
+    # The driver only stages the angle, flush() sends it to the PCA9685
+    driver.set_angle(servo_num, angle)
+    driver.flush()
 
 # Function to move to a square
 def move_to_position(target_square):
@@ -105,9 +82,9 @@ def move_to_position(target_square):
     print(f"Moving to {target_square} with angles (Servos 0-4): {[round(a, 1) for a in angles]}")
 
     for i, angle in enumerate(angles):
-        servos[i].angle = angle
+        set_servo(i, angle)
         print(f"Set servo {i} (channel {i+1}) to {angle:.1f} degrees")
-        time.sleep(0.5)  # Delay for smooth movement
+        driver.sleep(0.5)  # Delay for smooth movement
 
 # Main function to test the arm
 def main():
@@ -115,9 +92,9 @@ def main():
     print("Initializing all servos to 90 degrees...")
     neutral_angles = [90, 90, 90, 90, 0]  # Rest position (gripper closed)
     for i, angle in enumerate(neutral_angles):
-        servos[i].angle = angle
+        set_servo(i, angle)
         print(f"Set servo {i} (channel {i+1}) to {angle} degrees")
-        time.sleep(0.5)
+        driver.sleep(0.5)
 
     print("\nEnter a chess square (e.g., 'A7', 'D4') to move the arm to that position.")
     print("Type 'exit' to quit.")
@@ -152,13 +129,14 @@ def main():
     # Cleanup: Return to neutral position and deinitialize
     print("Returning to neutral position...")
     for i, angle in enumerate(neutral_angles):
-        servos[i].angle = angle
+        set_servo(i, angle)
         print(f"Set servo {i} (channel {i+1}) to {angle} degrees")
-        time.sleep(0.5)
-    pca.deinit()
+        driver.sleep(0.5)
+    driver.deinit()
     print("PCA9685 deinitialized")
 
 if __name__ == "__main__":
+    driver = sd.PCA9685Driver()
     try:
         main()
     except KeyboardInterrupt:
@@ -166,8 +144,8 @@ if __name__ == "__main__":
         # Cleanup on exit
         neutral_angles = [90, 90, 90, 90, 0]
         for i, angle in enumerate(neutral_angles):
-            servos[i].angle = angle
+            set_servo(i, angle)
             print(f"Set servo {i} (channel {i+1}) to {angle} degrees")
-            time.sleep(0.5)
-        pca.deinit()
+            driver.sleep(0.5)
+        driver.deinit()
         print("PCA9685 deinitialized")
\ No newline at end of file
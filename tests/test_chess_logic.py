@@ -0,0 +1,62 @@
+import chess
+import chess.engine
+import ChessLogic as cl
+
+def test_exact_match():
+    assert cl.moveAnalysis(["e2", "e4"], chess.Board()) == {"move": "e2e4", "type": "Move"}
+
+def test_ties_follow_the_vision_rank():
+    board = chess.Board()
+    # e2e4 and e2e3 both explain two of the three squares, the most changed ones win
+    assert cl.moveAnalysis(["e2", "e4", "e3"], board)["move"] == "e2e4"
+    assert cl.moveAnalysis(["e4", "e2", "e3"], board)["move"] == "e2e4"
+    assert cl.moveAnalysis(["e2", "e3", "e4"], board)["move"] == "e2e3"
+
+def test_match_without_rank_rejects_ties():
+    index = cl.MoveIndex(chess.Board())
+    changed = chess.BB_E2 | chess.BB_E3 | chess.BB_E4
+    assert index.match(changed)[0] == []
+    moves, score = index.match(changed, [chess.E4, chess.E2, chess.E3])
+    assert moves == [chess.Move.from_uci("e2e4")]
+    assert score == 2 / 3
+
+class ScriptedAnalysis:
+    # Finished MultiPV search: full strength lines, bestmove chosen at the Skill Level
+    def __init__(self, bestmove, scores):
+        self.bestmove = chess.engine.BestMove(chess.Move.from_uci(bestmove), None)
+        self.multipv = [{"pv": [chess.Move.from_uci(move)], "score": chess.engine.PovScore(chess.engine.Cp(cp), chess.WHITE)}
+                        for move, cp in scores]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def wait(self):
+        return self.bestmove
+
+class ScriptedEngine:
+    def __init__(self, bestmove, scores):
+        self.result = ScriptedAnalysis(bestmove, scores)
+
+    def analysis(self, board, limit=None, **kwargs):
+        return self.result
+
+LINES = [("e2e4", 50), ("d2d4", 40), ("g1f3", 30), ("a2a3", -100)]
+
+def armCost(cheapest):
+    return lambda seq: 1.0 if seq.startswith(cheapest) else 5.0
+
+def test_arm_aware_move_is_never_stronger_than_the_skill_move():
+    engine = ScriptedEngine("g1f3", LINES)
+    result = cl.armAwareMove(engine, chess.Board(), chess.engine.Limit(time=1), armCost("d2d4"))
+    assert result.move == chess.Move.from_uci("g1f3")
+
+def test_arm_aware_move_prefers_cheap_moves_below_the_skill_move():
+    engine = ScriptedEngine("e2e4", LINES)
+    result = cl.armAwareMove(engine, chess.Board(), chess.engine.Limit(time=1), armCost("d2d4"))
+    assert result.move == chess.Move.from_uci("d2d4")
+    assert result.info["armTime"] == 1.0
+    result = cl.armAwareMove(engine, chess.Board(), chess.engine.Limit(time=1), armCost("a2a3"))
+    assert result.move == chess.Move.from_uci("e2e4")
@@ -0,0 +1,60 @@
+import chess
+import GameClock as gc
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def robotMove(clock, fakeTime, thinking, moving):
+    # Black (robot) thinks, the arm moves, then the clock is pressed
+    fakeTime.now += thinking
+    clock.motion()
+    fakeTime.now += moving
+    clock.press(chess.BLACK)
+
+def test_limit_without_robot_gives_the_raw_clocks():
+    limit = gc.GameClock(300, 3, clock=FakeTime()).limit()
+    assert (limit.white_clock, limit.black_clock, limit.white_inc, limit.black_inc) == (300, 300, 3, 3)
+
+def test_limit_reserves_the_arm_motion_on_the_robot_clock():
+    fakeTime = FakeTime()
+    clock = gc.GameClock(600, 5, clock=fakeTime)
+    clock.start(chess.BLACK)
+    limit = clock.limit(chess.BLACK)
+    assert limit.white_clock == 600 and limit.white_inc == 5
+    assert limit.black_inc == 0
+    assert limit.black_clock == 600 - (gc.MOTION_TIME - 5) * gc.MOVES_TO_GO
+
+    robotMove(clock, fakeTime, 2, 9)
+    clock.press(chess.WHITE)
+    limit = clock.limit(chess.BLACK)
+    assert clock.motionPerMove(chess.BLACK) == 9
+    assert limit.black_clock == 600 - 11 + 5 - (9 - 5) * (gc.MOVES_TO_GO - 1)
+
+def playRobot(clock, fakeTime, robot, moving=12):
+    # Engine time as clock / 20 + increment, the arm takes `moving` seconds per move, the human plays instantly
+    clock.start(chess.BLACK)
+    for _ in range(gc.MOVES_TO_GO):
+        limit = clock.limit(chess.BLACK if robot else None)
+        robotMove(clock, fakeTime, limit.black_clock / 20 + limit.black_inc, moving)
+        clock.press(chess.WHITE)
+        if clock.flagged(chess.BLACK):
+            return False
+    return True
+
+def test_robot_does_not_flag_with_the_motion_reserve():
+    fakeTime = FakeTime()
+    assert not playRobot(gc.GameClock(600, 5, clock=fakeTime), fakeTime, robot=False)
+    fakeTime = FakeTime()
+    assert playRobot(gc.GameClock(600, 5, clock=fakeTime), fakeTime, robot=True)
+
+def test_estimated_motion_leaves_the_engine_time_at_5_3():
+    # Quiet moves take about 9 s of arm motion with the measured arm model
+    fakeTime = FakeTime()
+    clock = gc.GameClock(300, 3, clock=fakeTime, motionTime=9)
+    clock.start(chess.BLACK)
+    assert clock.limit(chess.BLACK).black_clock == 300 - (9 - 3) * gc.MOVES_TO_GO
+    assert playRobot(clock, fakeTime, robot=True, moving=9)
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import chess
+import chess.engine
+import pytest
+import ArmControl as ac
+import GameClock as gc
+import GameController as gmc
+import MotionExecutor as me
+import ServoDriver as sd
+
+PARAMS_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'params.txt')
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+        self.cancelled = 0
+
+    def submit(self, coroutine):
+        coroutine.close()
+        self.submitted.append(coroutine)
+
+    def execute_move(self, *args):
+        return me.MotionExecutor().execute_move(*args)
+
+    def cancel(self):
+        self.cancelled += 1
+
+    pause = resume = lambda self: None
+
+class RecordingPonderer:
+    def __init__(self):
+        self.started = []
+
+    def start(self, board, move):
+        self.started.append(move)
+
+class IdleWatcher:
+    def __init__(self, *args):
+        pass
+
+    ignore = start = stop = lambda self, *args: None
+
+def controller(monkeypatch):
+    c = gmc.GameController(None, None, None, RecordingExecutor(), {})
+    c.camera = type("Camera", (), {"read": lambda self: (False, None)})()
+    c.homography = c.rotMat = None
+    c.playerColor = chess.WHITE
+    c.game = 1
+    c.playing = True
+    c.board = chess.Board()
+    c.state = "pcTurn"
+    c.skillLevel = 20
+    c.ponderer = RecordingPonderer()
+    move = chess.engine.PlayResult(chess.Move.from_uci("e2e4"), None)
+    monkeypatch.setattr(c, "_searchMove", lambda board: (move, {"seq": "e2e4", "type": "Move"}))
+    monkeypatch.setattr(gmc.vm, "BoardWatcher", IdleWatcher)
+    return c, move
+
+def test_robot_does_not_move_after_the_game_ended(monkeypatch):
+    c, move = controller(monkeypatch)
+    c.playing = False
+    c._robotTurn(c.board.copy(), 1)
+    c.playing = True
+    c.game = 2
+    c._robotTurn(c.board.copy(), 1)
+    assert c.motionExecutor.submitted == []
+    assert c._events.empty()
+
+def test_robot_results_of_older_games_are_ignored(monkeypatch):
+    c, move = controller(monkeypatch)
+    c.game = 2
+    c._robotDone(move, {"seq": "e2e4", "type": "Move"}, game=1)
+    c._robotDone(chess.engine.PlayResult(chess.Move.from_uci("e7e5"), None), {"seq": "e7e5"}, game=2)
+    assert c.board.move_stack == []
+
+def test_ponder_only_when_the_search_uses_it(monkeypatch):
+    c, move = controller(monkeypatch)
+    c.skillLevel = gmc.ARM_AWARE_SKILL
+    c._robotDone(move, {"seq": "e2e4", "type": "Move"}, game=1)
+    assert c.ponderer.started == []
+    c.skillLevel = gmc.ARM_AWARE_SKILL + 1
+    c.state = "pcTurn"
+    c._robotDone(chess.engine.PlayResult(chess.Move.from_uci("e7e5"), None), {"seq": "e7e5", "type": "Move"}, game=1)
+    assert len(c.ponderer.started) == 1
+
+def test_game_over_sends_the_arm_back_to_rest(monkeypatch):
+    driver = sd.SimulatedDriver()
+    monkeypatch.setattr(ac, "driver", driver)
+    monkeypatch.setattr(ac, "current_angles", [90, 90, 30, 90, ac.gOpen])
+    c, move = controller(monkeypatch)
+    c.motionExecutor = me.MotionExecutor()
+    c.ponderer = type("Ponderer", (), {"stop": lambda self: None})()
+    reached, release = threading.Event(), threading.Event()
+    def gate(done, total):
+        if done == 1:
+            reached.set()
+            release.wait(5)
+    carrying = c.motionExecutor.submit(c.motionExecutor.move_to_pose([150, 60, 90, 40, ac.gClose], progress=gate))
+    assert reached.wait(5)
+    c._gameOver()
+    release.set()
+    with pytest.raises(me.MotionCancelled):
+        carrying.result(5)
+    c.motionExecutor.submit(c.motionExecutor.move_to_pose([None] * 5)).result(5)  # Runs after the rest move
+    assert ac.current_angles[:4] == ac.angles_rest[:4]
+    assert not c.playing
+
+def test_clock_motion_is_seeded_from_the_arm_estimates(monkeypatch):
+    c, move = controller(monkeypatch)
+    with open(PARAMS_FILE) as json_file:
+        c.params = json.load(json_file)
+    c.board = chess.Board()
+    motion = c.typicalMoveTime()
+    assert 5 < motion < gc.MOTION_TIME
+    clock = gc.GameClock(*gmc.TIME_CONTROLS["5+3"], motionTime=motion)
+    clock.start(chess.BLACK)
+    assert clock.limit(chess.BLACK).black_clock > 0
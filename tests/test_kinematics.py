@@ -0,0 +1,53 @@
+import json
+import os
+import numpy as np
+import ArmControl as ac
+import Kinematics as kin
+
+PARAMS_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'params.txt')
+
+def loadParams():
+    with open(PARAMS_FILE) as json_file:
+        return json.load(json_file)
+
+def measured():
+    return ac.measured_angles(ac.MEASURED_COLOR)
+
+def test_model_reproduces_measured_squares():
+    params = loadParams()
+    error = kin.modelError(measured(), params, ac.MEASURED_COLOR, ac.PICK_DEPTH * params["pieceHeight"])
+    assert error <= ac.MODEL_TOLERANCE * params["sqSize"]
+
+def test_base_yaw_matches_measured_files():
+    params = loadParams()
+    table = kin.angleTable(params, ac.MEASURED_COLOR, ac.PICK_DEPTH * params["pieceHeight"])
+    for square in ("a4", "a5", "h4", "h5"):
+        assert abs(table[kin.squareIndex(square), kin.GRASP, 0] - measured()[square][0]) < 10
+
+def test_unvalidated_model_only_reaches_measured_squares(monkeypatch):
+    params = loadParams()
+    monkeypatch.setattr(kin, "SERVO_MAP", [(90, 1), (180, -1), (180, 1), (90, 1)])
+    kin._angleTable.cache_clear()
+    try:
+        goDown = ac.PICK_DEPTH * params["pieceHeight"]
+        assert ac.square_pose("k0", params, ac.MEASURED_COLOR, goDown) is None
+        assert ac.square_pose("e1", params, ac.MEASURED_COLOR, goDown) is None
+        assert ac.square_pose("a8", params, ac.MEASURED_COLOR, goDown) == measured()["a8"]
+    finally:
+        kin._angleTable.cache_clear()
+
+def test_out_of_range_squares_are_unreachable():
+    params = loadParams()
+    for color in (True, False):
+        table = ac.angle_table(params, color, ac.PICK_DEPTH * params["pieceHeight"])
+        reachable = ~np.isnan(table).any(axis=-1)
+        assert ((table[reachable] >= 0) & (table[reachable] <= 180)).all()
+    for square in ("a1", "e1", "h1"):
+        assert ac.square_pose(square, params, ac.MEASURED_COLOR, ac.PICK_DEPTH * params["pieceHeight"]) is None
+
+def test_measured_squares_follow_the_orientation():
+    params = loadParams()
+    goDown = ac.PICK_DEPTH * params["pieceHeight"]
+    assert ac.square_pose("a1", params, not ac.MEASURED_COLOR, goDown) == ac.square_angles["H8"]
+    assert ac.square_pose("e6", params, not ac.MEASURED_COLOR, goDown) == ac.square_angles["D3"]
+    assert ac.square_pose("a8", params, not ac.MEASURED_COLOR, goDown) is None
@@ -0,0 +1,45 @@
+import threading
+import pytest
+import ArmControl as ac
+import MotionExecutor as me
+import ServoDriver as sd
+
+REST = [90, 90, 30, 90, 0]
+AWAY = [150, 60, 90, 40, 0]
+
+@pytest.fixture
+def simulated(monkeypatch):
+    driver = sd.SimulatedDriver()
+    monkeypatch.setattr(ac, "driver", driver)
+    monkeypatch.setattr(ac, "current_angles", list(REST))
+    return driver
+
+class Gate:
+    # Progress callback that holds the move on its first tick until released
+    def __init__(self):
+        self.reached = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, done, total):
+        if done == 1:
+            self.reached.set()
+            self.release.wait(5)
+
+def test_cancel_stops_running_and_queued_moves(simulated):
+    executor = me.MotionExecutor()
+    gate = Gate()
+    running = executor.submit(executor.move_to_pose(AWAY, progress=gate))
+    queued = executor.submit(executor.move_to_pose(REST))
+    assert gate.reached.wait(5)
+    executor.cancel()
+    gate.release.set()
+    for future in (running, queued):
+        with pytest.raises(me.MotionCancelled):
+            future.result(5)
+    assert ac.current_angles != AWAY
+
+def test_moves_submitted_after_cancel_run(simulated):
+    executor = me.MotionExecutor()
+    executor.cancel()
+    assert executor.submit(executor.move_to_pose(AWAY)).result(5)
+    assert ac.current_angles == AWAY
@@ -0,0 +1,61 @@
+import chess
+import cv2
+import numpy as np
+import VisionModule as vm
+
+FPS = 30
+SKIN = (120, 170, 230)
+
+def render(board, arm=None):
+    # Straight top view of the board, files down the image and rank 1 on the left
+    img = np.full((400, 400, 3), 120, np.uint8)
+    for square, piece in board.piece_map().items():
+        center = (chess.square_rank(square) * 50 + 25, chess.square_file(square) * 50 + 25)
+        cv2.circle(img, center, 16, (250,) * 3 if piece.color else (10,) * 3, -1)
+    if arm:
+        cv2.rectangle(img, arm[0], arm[1], SKIN, -1)
+    return img
+
+def feed(detector, frames, start=0.0):
+    # Frames as (image, count) at 30 fps, returns the times the detector fired
+    t, fired = start, []
+    for img, count in frames:
+        for _ in range(count):
+            t += 1 / FPS
+            if detector.feed(img, t):
+                fired.append(t)
+    return fired
+
+def detector(board):
+    d = vm.MoveDetector(np.eye(3), vm.findRotation(0), playerColor=True)
+    d.reset(render(board))
+    return d
+
+def test_fires_once_settled_after_the_hand_leaves():
+    before = chess.Board()
+    after = before.copy()
+    after.push_uci("e2e4")
+    arm = ((0, 185), (190, 245))
+    fired = feed(detector(before), [(render(before, arm), FPS), (render(after), 2 * FPS)])
+    assert len(fired) == 1
+    assert 1.0 + 0.5 <= fired[0] <= 1.0 + 0.5 + 3 / FPS
+
+def test_arm_held_still_over_the_board_does_not_fire():
+    before = chess.Board()
+    held = before.copy()
+    held.remove_piece_at(chess.E2)
+    after = before.copy()
+    after.push_uci("e2e4")
+    # About a square wide along the e-file, so only the four squares it covers change
+    arm = ((0, 203), (185, 247))
+    d = detector(before)
+    assert feed(d, [(render(before, arm), 10), (render(held, arm), 3 * FPS)]) == []
+    assert len(feed(d, [(render(after), 2 * FPS)])) == 1
+
+def test_moves_along_the_edge_fire():
+    for fen, move in ((chess.STARTING_FEN, "g1f3"), ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "e1g1")):
+        before = chess.Board(fen)
+        after = before.copy()
+        after.push_uci(move)
+        arm = ((0, 0), (150, 400))
+        assert len(feed(detector(before), [(render(before, arm), 20), (render(after), 2 * FPS)])) == 1
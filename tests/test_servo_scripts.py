@@ -0,0 +1,26 @@
+import ServoDriver as sd
+import T1
+import testArm
+
+def fakeDriver(monkeypatch, module):
+    bus = sd.FakeI2CBus()
+    driver = sd.PCA9685Driver(i2c=bus)
+    monkeypatch.setattr(driver, "sleep", lambda seconds: None)
+    monkeypatch.setattr(module, "driver", driver)
+    bus.reset()
+    return driver, bus
+
+def test_t1_sends_every_step(monkeypatch):
+    driver, bus = fakeDriver(monkeypatch, T1)
+    monkeypatch.setattr(T1, "current_angles", [90, 90, 30, 90, 20])
+    T1.move_servo_slowly(0, 120)
+    assert bus.transactions == 31  # 90..120 in 1 degree steps
+    assert not driver.pending
+    assert driver.counts[sd.SERVO_CHANNELS[0]] == driver.angle_to_count(120)
+
+def test_testarm_sends_every_servo(monkeypatch):
+    driver, bus = fakeDriver(monkeypatch, testArm)
+    testArm.move_to_position("e4")
+    assert bus.transactions == 5
+    assert not driver.pending
+    assert all(driver.counts[channel] is not None for channel in sd.SERVO_CHANNELS)
@@ -0,0 +1,22 @@
+import cv2
+import numpy as np
+import VisionModule as vm
+
+def noisyFrame(seed=0):
+    # Flat gray board under strong per-pixel camera noise
+    rng = np.random.default_rng(seed)
+    return np.clip(120 + rng.normal(0, 60, (400, 400, 3)), 0, 255).astype(np.uint8)
+
+def test_noise_is_averaged_over_the_watch_pixels():
+    frame = noisyFrame()
+    small = vm.watchImage(frame, vm.fuseRotation(np.eye(3)))
+    # A true area resize of the same frame, with the same blur
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    area = cv2.GaussianBlur(cv2.resize(gray, (vm.WATCH_SIZE, vm.WATCH_SIZE), interpolation=cv2.INTER_AREA), (5, 5), 0)
+    assert small.std() < 1.5 * area.std()
+    assert abs(float(small.mean()) - float(gray.mean())) < 2
+
+def test_same_scene_under_new_noise_stays_still():
+    M = vm.fuseRotation(np.eye(3))
+    diff = cv2.absdiff(vm.watchImage(noisyFrame(0), M), vm.watchImage(noisyFrame(1), M))
+    assert np.count_nonzero(diff > 30) == 0